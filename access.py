@@ -0,0 +1,117 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+from array import array
+from collections import defaultdict
+
+from operands import *
+
+READ, WRITE, RMW = 'r', 'w', 'm'
+
+DIRECT_MODES = (M_ABS, M_ABSX, M_ABSY, M_ZERO, M_ZERX, M_ZERY)
+POINTER_MODES = (M_INDX, M_INDY)
+
+# undocumented NOPs with an operand, which they don't use, aliases included
+SKIPS = ('SKB', 'SKW')
+
+def accesses(instr):
+    """The (addr, kind) data accesses of an instruction. Indexed modes count
+    as an access to their base address; indirect ones as a read of the
+    pointer."""
+    opcode = instr.opcode
+    if opcode.mnemonic[:3] in SKIPS:
+        return []
+
+    result = []
+
+    if opcode.src in DIRECT_MODES:
+        if opcode.dst is opcode.src:
+            return [(instr.src.addr, RMW)]
+
+        result.append((instr.src.addr, READ))
+    elif opcode.dst in DIRECT_MODES:
+        result.append((instr.dst.addr, WRITE))
+
+    if opcode.src in POINTER_MODES:
+        result.append((instr.src.offset, READ))
+        result.append(((instr.src.offset + 1) & 0xff, READ))
+    elif opcode.dst in POINTER_MODES:
+        result.append((instr.dst.offset, READ))
+        result.append(((instr.dst.offset + 1) & 0xff, READ))
+    elif opcode.src == M_AIND:
+        result.append((instr.src.addr, READ))
+        result.append(((instr.src.addr + 1) & 0xffff, READ))
+
+    return result
+
+class AccessCounters(object):
+    """Number of instructions reading, writing and read-modify-writing each
+    address, plus the addresses of those instructions."""
+
+    def __init__(self, size=0x10000):
+        self.reads = array('I', [0]) * size
+        self.writes = array('I', [0]) * size
+        self.rmws = array('I', [0]) * size
+        self.sites = defaultdict(set)
+
+        # instruction addr -> its accesses, to be able to forget them
+        self.counted = {}
+
+    def counters(self, kind):
+        return {READ: self.reads, WRITE: self.writes, RMW: self.rmws}[kind]
+
+    def count(self, site, instr):
+        if site in self.counted:
+            return
+
+        self.counted[site] = result = accesses(instr)
+        for addr, kind in result:
+            self.counters(kind)[addr] += 1
+            self.sites[addr].add(site)
+
+    def forget(self, site):
+        for addr, kind in self.counted.pop(site, ()):
+            self.counters(kind)[addr] -= 1
+            self.sites[addr].discard(site)
+
+    def report(self, memory, ranges):
+        """A table of the accesses in the given (start, end) ranges."""
+        routine_at = memory.routine_finder()
+
+        def routine_of(site):
+            entry = routine_at(site)
+            return 'UNKNOWN' if entry is None else memory.addr_label(entry)
+
+        lines = ['%-5s %-8s %5s %6s %4s  %s' % ('addr', 'label', 'reads', 'writes', 'rmw', 'routines')]
+
+        for start, end in ranges:
+            used = 0
+
+            for addr in xrange(start, end + 1):
+                reads, writes, rmws = self.reads[addr], self.writes[addr], self.rmws[addr]
+                if not (reads or writes or rmws):
+                    continue
+
+                used += 1
+                routines = sorted(set(routine_of(site) for site in self.sites[addr]))
+                lines.append('%04X  %-8s %5d %6d %4d  %s' % (addr, memory.addr_label(addr, size=2),
+                                                              reads, writes, rmws, ' '.join(routines)))
+
+            lines.append('$%04X-$%04X: %d of %d addresses used' % (start, end, used, end - start + 1))
+            lines.append('')
+
+        return '\n'.join(lines)
@@ -0,0 +1,111 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import bz2
+import os
+import tarfile
+import zipfile
+import zlib
+
+from fnmatch import fnmatch
+
+class NotAnArchiveError(Exception):
+    def __str__(self):
+        return 'not a zip or tar archive ' + self.message
+
+# zip local file header, or end of central directory of an empty archive
+ZIP_MAGIC = ('PK\x03\x04', 'PK\x05\x06')
+# the tar headers of POSIX and GNU tar
+TAR_MAGIC = 'ustar'
+TAR_MAGIC_OFFSET = 257
+
+def decompress_start(data):
+    """The first bytes of the gzip or bzip2 compressed data, None if it
+    isn't compressed."""
+    try:
+        if data.startswith('\x1f\x8b'):
+            # gzip header, skipped by zlib
+            return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+        elif data.startswith('BZh'):
+            return bz2.BZ2Decompressor().decompress(data)
+    except (zlib.error, IOError, EOFError):
+        pass
+
+    return None
+
+def archive_kind(path):
+    """'zip', 'tar' or None, from the magic numbers. tarfile.is_tarfile()
+    isn't enough: it takes a ROM starting with 512 zero bytes for an empty
+    tar archive."""
+    with open(path, 'rb') as file_:
+        data = file_.read(0x10000)
+
+    if data.startswith(ZIP_MAGIC) and zipfile.is_zipfile(path):
+        return 'zip'
+
+    start = decompress_start(data)
+    if start is None:
+        start = data
+    if start[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET+len(TAR_MAGIC)] == TAR_MAGIC:
+        return 'tar'
+
+    return None
+
+def is_archive(path):
+    return archive_kind(path) is not None
+
+def matches(name, patterns):
+    return any(fnmatch(name, pattern) for pattern in patterns)
+
+def member_stem(name):
+    """The path of a member without extension, kept inside the current
+    directory: '../roms/game.bin' gives 'roms/game'."""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+
+    return os.path.splitext(os.path.join(*parts))[0] if parts else ''
+
+def open_members(path, patterns=('*',)):
+    """Yield (name, file) for the archive members matching any of the glob
+    patterns, one at a time and without extracting them. Each file is only
+    valid until the next one is produced."""
+    kind = archive_kind(path)
+
+    if kind == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.filename.endswith('/') or not matches(info.filename, patterns):
+                    continue
+
+                file_ = archive.open(info)
+                try:
+                    yield info.filename, file_
+                finally:
+                    file_.close()
+    elif kind == 'tar':
+        # stream mode: the (possibly compressed) archive is read sequentially
+        archive = tarfile.open(path, 'r|*')
+        try:
+            for info in archive:
+                if info.isfile() and matches(info.name, patterns):
+                    yield info.name, archive.extractfile(info)
+
+                # don't keep the headers of the members already seen
+                archive.members = []
+        finally:
+            archive.close()
+    else:
+        raise NotAnArchiveError(path)
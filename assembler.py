@@ -0,0 +1,314 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import re
+
+from collections import namedtuple
+
+from operands import *
+from table import EXTENDED, TABLE, UNDOCUMENTED
+
+# Assembles the listings written by --disassemble: labels, instructions,
+# .byt, .word, '* = ADDR' and 'SYMBOL = VALUE' equates. Operands are
+# expressions made of symbols and $hex, decimal or %binary numbers added or
+# subtracted; a $ number of 1 or 2 digits, or a symbol defined before and
+# below $100, selects the zero page modes.
+
+EQUATE = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*|\*)\s*=\s*(.+)$')
+TERM = re.compile(r'\s*([-+]?)\s*(\$[0-9A-Fa-f]+|%[01]+|[0-9]+|[A-Za-z_][A-Za-z0-9_]*)\s*')
+
+# section names written in the listings, nothing to assemble
+SECTIONS = ('code', 'data')
+
+ZERO_PAGE = {M_ABS: M_ZERO, M_ABSX: M_ZERX, M_ABSY: M_ZERY}
+
+# args are (mnemonic, operand mode, expression) for instructions and the
+# expressions for .byt and .word
+Statement = namedtuple('Statement', 'kind addr line args')
+
+# (addr, expected byte, assembled byte, line number): a byte is None where
+# nothing was assembled, or outside of the ROM
+Mismatch = namedtuple('Mismatch', 'addr expected assembled line')
+
+class AssemblyError(Exception):
+    def __init__(self, line, message):
+        Exception.__init__(self, line, message)
+        self.line = line
+        self.detail = message
+
+    def __str__(self):
+        return 'line %d: %s' % (self.line, self.detail)
+
+def inverse_table(undocumented=False):
+    """(mnemonic, operand mode) -> opcode, the documented opcodes first."""
+    inverse = {}
+
+    for table in (TABLE, UNDOCUMENTED) if undocumented else (TABLE,):
+        for code, opcode in sorted(table.items()):
+            inverse.setdefault((opcode.mnemonic, operand_mode(opcode)), code)
+
+    return inverse
+
+class Assembler(object):
+    """Two pass assembler. The first pass sizes the instructions and defines
+    the labels, the second one writes the bytes, into image for the
+    addresses set in written."""
+
+    def __init__(self, undocumented=False):
+        self.opcodes = inverse_table(undocumented)
+        self.sizes = dict((code, opcode.size) for code, opcode in EXTENDED.items())
+        self.mnemonics = set(mnemonic for mnemonic, mode in self.opcodes)
+
+    def assemble(self, lines):
+        self.symbols = {}
+        self.errors = []
+        self.image = bytearray(0x10000)
+        self.written = bytearray(0x10000)
+        # addr -> line number of the statement writing it
+        self.line_of = {}
+
+        statements = []
+        pc = 0
+        for number, line in enumerate(lines, 1):
+            try:
+                statement = self.parse(number, line, pc)
+                if statement is not None:
+                    statements.append(statement)
+                    pc = statement.addr + self.size(statement)
+            except AssemblyError as e:
+                self.errors.append(e)
+
+        for statement in statements:
+            try:
+                self.emit(statement)
+            except AssemblyError as e:
+                self.errors.append(e)
+
+        return self
+
+    def value(self, number, text, required=True):
+        """(value, zero page) of an expression. The value is None if it uses
+        a symbol not defined yet and isn't required."""
+        total, pos, zero_page = 0, 0, None
+
+        while pos < len(text):
+            match = TERM.match(text, pos)
+            if not match or (pos and not match.group(1)):
+                raise AssemblyError(number, 'invalid expression ' + text)
+            pos = match.end()
+
+            sign, term = match.groups()
+            if term[0] == '$':
+                value = int(term[1:], 16)
+                zero_page = len(term) <= 3 if zero_page is None else False
+            elif term[0] == '%':
+                value = int(term[1:], 2)
+            elif term[0].isdigit():
+                value = int(term)
+            elif term in self.symbols:
+                value = self.symbols[term]
+            elif required:
+                raise AssemblyError(number, 'undefined symbol ' + term)
+            else:
+                return None, False
+
+            total += -value if sign == '-' else value
+
+        if not text.strip():
+            raise AssemblyError(number, 'missing value')
+
+        if zero_page is None:
+            zero_page = total < 0x100
+
+        return total & 0xffff, zero_page
+
+    def define(self, number, symbol, value):
+        if symbol in self.symbols and self.symbols[symbol] != value:
+            raise AssemblyError(number, '%s redefined' % symbol)
+
+        self.symbols[symbol] = value
+
+    def parse(self, number, line, pc):
+        """The Statement of a line, None if there's nothing to assemble."""
+        line = line.split(';', 1)[0].rstrip()
+        if not line.strip():
+            return None
+
+        match = EQUATE.match(line)
+        if match:
+            symbol, expression = match.groups()
+            value, zero_page = self.value(number, expression)
+            if symbol == '*':
+                return Statement('*', value, number, None)
+
+            self.define(number, symbol, value)
+            return None
+
+        if not line[0].isspace():
+            label, line = (line.split(None, 1) + [''])[:2]
+            self.define(number, label.rstrip(':'), pc)
+
+        parts = line.split(None, 1)
+        if not parts:
+            return None
+
+        op = parts[0]
+        operand = parts[1].strip() if len(parts) > 1 else ''
+
+        if op in SECTIONS and not operand:
+            return None
+        elif op in ('.byt', '.byte'):
+            return Statement('.byt', pc, number, [item.strip() for item in operand.split(',')])
+        elif op == '.word':
+            return Statement('.word', pc, number, [item.strip() for item in operand.split(',')])
+
+        mnemonic = op.upper()
+        if mnemonic not in self.mnemonics:
+            raise AssemblyError(number, 'unknown instruction ' + op)
+
+        return Statement('instr', pc, number, (mnemonic,) + self.mode(number, mnemonic, operand))
+
+    def mode(self, number, mnemonic, operand):
+        """(operand mode, expression) of an instruction."""
+        if operand in ('', 'A', 'a'):
+            return None, None
+
+        for regexp, modes in OPERAND_SYNTAX:
+            match = regexp.match(operand)
+            if not match:
+                continue
+
+            expression = match.group(1).strip()
+            candidates = [mode for mode in modes if (mnemonic, mode) in self.opcodes]
+            if not candidates:
+                break
+
+            if M_REL in candidates:
+                return M_REL, expression
+            if M_ADDR in candidates:
+                return M_ADDR, expression
+
+            absolute = [mode for mode in candidates if mode not in ZERO_PAGE.values()]
+            zero_page = [mode for mode in candidates if mode in ZERO_PAGE.values()]
+            if absolute and zero_page:
+                value, is_zero_page = self.value(number, expression, required=False)
+                return (zero_page if is_zero_page else absolute)[0], expression
+
+            return candidates[0], expression
+
+        raise AssemblyError(number, 'invalid operand %s for %s' % (operand, mnemonic))
+
+    def size(self, statement):
+        if statement.kind == 'instr':
+            mnemonic, mode, expression = statement.args
+            return self.sizes[self.opcodes[mnemonic, mode]]
+        elif statement.kind == '.byt':
+            return len(statement.args)
+        elif statement.kind == '.word':
+            return 2 * len(statement.args)
+
+        return 0
+
+    def write(self, number, addr, values):
+        for i, byte in enumerate(values):
+            self.image[(addr + i) & 0xffff] = byte
+            self.written[(addr + i) & 0xffff] = 1
+            self.line_of[(addr + i) & 0xffff] = number
+
+    def emit(self, statement):
+        kind, addr, number = statement.kind, statement.addr, statement.line
+
+        if kind == '.byt':
+            values = [self.value(number, item)[0] for item in statement.args]
+            if any(value > 0xff for value in values):
+                raise AssemblyError(number, 'byte out of range')
+
+            self.write(number, addr, values)
+        elif kind == '.word':
+            values = []
+            for item in statement.args:
+                value = self.value(number, item)[0]
+                values.extend((value & 0xff, value >> 8))
+
+            self.write(number, addr, values)
+        elif kind == 'instr':
+            mnemonic, mode, expression = statement.args
+            code = self.opcodes[mnemonic, mode]
+
+            if mode is None:
+                self.write(number, addr, [code])
+                return
+
+            value = self.value(number, expression)[0]
+            if mode == M_REL:
+                offset = value - (addr + 2)
+                if offset < -128 or offset > 127:
+                    raise AssemblyError(number, 'branch out of range')
+                self.write(number, addr, [code, offset & 0xff])
+            elif mode in (M_IMM, M_INDX, M_INDY) or mode in ZERO_PAGE.values():
+                if value > 0xff:
+                    raise AssemblyError(number, 'operand out of range')
+                self.write(number, addr, [code, value])
+            else:
+                self.write(number, addr, [code, value & 0xff, value >> 8])
+
+    def compare(self, rom, org, limit=10):
+        """The first limit Mismatches between the assembled bytes and rom,
+        loaded at org."""
+        mismatches = []
+        end = org + len(rom)
+
+        rom = bytearray(rom)
+        if self.image[org:end] == rom and '\0' not in self.written[org:end] and \
+                '\1' not in self.written[:org] and '\1' not in self.written[end:]:
+            return mismatches
+
+        for addr in xrange(0x10000):
+            in_rom = org <= addr < end
+            expected = rom[addr - org] if in_rom else None
+            assembled = self.image[addr] if self.written[addr] else None
+
+            if expected != assembled:
+                mismatches.append(Mismatch(addr, expected, assembled, self.line_of.get(addr)))
+                if len(mismatches) >= limit:
+                    break
+
+        return mismatches
+
+def verify(lines, rom, org, undocumented=False, limit=10):
+    """(errors, mismatches) of assembling the listing lines against rom."""
+    assembler = Assembler(undocumented).assemble(lines)
+
+    return assembler.errors[:limit], assembler.compare(rom, org, limit)
+
+def report(errors, mismatches, lines):
+    """Text describing the result of verify()."""
+    if not errors and not mismatches:
+        return 'OK'
+
+    def byte(value):
+        return '--' if value is None else '%02X' % value
+
+    text = []
+    for error in errors:
+        text.append(str(error))
+
+    for mismatch in mismatches:
+        source = '' if mismatch.line is None else '  line %d: %s' % (mismatch.line, lines[mismatch.line-1].strip())
+        text.append('%04X: %s expected, %s assembled%s' % (mismatch.addr, byte(mismatch.expected), byte(mismatch.assembled), source))
+
+    return '\n'.join(text)
@@ -17,6 +17,8 @@
 
 import memory
 
+from symbols import SymbolTable
+
 SYMBOLS = {
     0x00: 'VSYNC',
     0x01: 'VBLANK',
@@ -70,13 +72,20 @@ SYMBOLS = {
     0x0296: 'TIM64T',
 }
 
+# RAM, then TIA and RIOT registers
+USAGE_RANGES = (
+    (0x80, 0xFF),
+    (0x00, 0x3F),
+    (0x280, 0x297),
+)
+
 class UnexpectedROMSizeError(Exception):
     def __str__(self):
         return 'unexpected ROM size ' + self.message
 
 class Memory(memory.Memory):
     @classmethod
-    def from_file(cls, file_, org=None, symbols=None):
+    def from_file(cls, file_, org=None, symbols=None, undocumented=False):
         memory = file_.read()
 
         if len(memory) not in (2048, 4096):
@@ -85,9 +94,12 @@ class Memory(memory.Memory):
         if org is None:
             org = 0x10000 - len(memory)
 
-        syms = SYMBOLS
+        syms = SymbolTable(SYMBOLS)
 
         if symbols:
             syms.update(symbols)
 
-        return cls(memory, org, symbols=syms)
+        return cls(memory, org, symbols=syms, undocumented=undocumented)
+
+    def ram_usage(self):
+        return self.access.report(self, USAGE_RANGES)
@@ -0,0 +1,302 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import json
+
+from operands import *
+from table import TABLE
+
+# bytes pushed on the stack by each opcode, JSR is accounted separately
+STACK_EFFECT = dict((code, 1 if op.mnemonic in ('PHA', 'PHP') else -1)
+                    for code, op in TABLE.items()
+                    if op.mnemonic in ('PHA', 'PHP', 'PLA', 'PLP'))
+
+# a routine pushing more than this is broken anyway, bounds the analysis of
+# loops pushing on the stack
+MAX_STACK = 256
+
+CALL, JUMP = 'call', 'jump'
+
+class Routine(object):
+    def __init__(self, addr, name):
+        self.addr = addr
+        self.name = name
+
+        self.local_stack = 0
+        # (kind, destination addr) -> [number of sites, max stack depth at the sites]
+        self.edges = {}
+        self.edge_order = []
+
+        self.scc = None
+        self.recursive = False
+        self.unbounded = False
+        self.depth = 0
+        self.stack = 0
+        self.chain = []
+
+    def add_edge(self, kind, dest_addr, depth):
+        key = kind, dest_addr
+        if key in self.edges:
+            edge = self.edges[key]
+            edge[0] += 1
+            edge[1] = max(edge[1], depth)
+        else:
+            self.edges[key] = [1, depth]
+            self.edge_order.append(key)
+
+class CallGraph(object):
+    """Calls (JSR) and tail jumps (JMP) between the traced routines.
+
+    For every routine it computes the maximum JSR nesting and the worst case
+    number of bytes pushed on the stack, including return addresses and
+    PHA/PHP, by itself and the routines it calls. Routines in a strongly
+    connected component containing a call are recursive; their depth and
+    stack, and those of the routines reaching them, are None (unbounded).
+
+    The graph is built from the traced instructions, with the destinations
+    recorded by the tracer and the resolver."""
+
+    def __init__(self, memory, starts):
+        self.memory = memory
+        self.instrs = dict(memory.traced_instrs())
+        self.routines = {}
+        self.order = []
+        self.sccs = []
+
+        todo = list(starts)
+        while todo:
+            addr = todo.pop(0)
+            if addr in self.routines:
+                continue
+
+            routine = self.routines[addr] = Routine(addr, memory.addr_label(addr))
+            self.order.append(addr)
+
+            self.walk(routine)
+
+            todo.extend(dest_addr for kind, dest_addr in routine.edge_order if dest_addr not in self.routines)
+
+        self.find_sccs()
+        self.measure()
+
+    def name_of(self, addr):
+        return self.memory.addr_label(addr)
+
+    def walk(self, routine):
+        """Follow the code of a routine, recording calls, jumps and the stack
+        depth reached, relative to the routine entry."""
+        memory = self.memory
+        instrs = self.instrs
+
+        depth_at = {}
+        todo = [(routine.addr, 0)]
+
+        while todo:
+            addr, depth = todo.pop()
+
+            while addr in instrs and depth <= MAX_STACK:
+                if addr in depth_at and depth_at[addr] >= depth:
+                    break
+
+                depth_at[addr] = depth
+                routine.local_stack = max(routine.local_stack, depth)
+
+                instr = instrs[addr]
+                opcode = instr.opcode
+
+                depth += STACK_EFFECT.get(memory[addr], 0)
+
+                if opcode.src == M_REL:
+                    todo.append((addr + opcode.size + instr.src.offset, depth))
+                elif opcode.dst == M_PC:
+                    if opcode.mnemonic == 'JSR':
+                        dest_addr = memory.calls.get(addr, instr.src.addr)
+                        routine.add_edge(CALL, dest_addr, depth)
+                        routine.local_stack = max(routine.local_stack, depth + 2)
+                    else:
+                        if opcode.mnemonic == 'JMP' and opcode.src != M_AIND:
+                            routine.add_edge(JUMP, memory.jumps.get(addr, instr.src.addr), depth)
+
+                        # resolved JMP (ind), or RTS consuming the address pushed
+                        for dest_addr in sorted(memory.dispatches.get(addr, ())):
+                            routine.add_edge(JUMP, dest_addr, depth - 2 if opcode.mnemonic == 'RTS' else depth)
+
+                        break
+
+                addr += opcode.size
+
+    def find_sccs(self):
+        """Tarjan's algorithm, without recursion. The components come out in
+        reverse topological order: callees before callers."""
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+
+        def successors(addr):
+            return [dest_addr for kind, dest_addr in self.routines[addr].edge_order
+                    if dest_addr in self.routines]
+
+        for root in self.order:
+            if root in index:
+                continue
+
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(successors(root)))]
+
+            while work:
+                addr, children = work[-1]
+
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(successors(child))))
+                        break
+                    elif child in on_stack:
+                        lowlink[addr] = min(lowlink[addr], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[addr])
+
+                    if lowlink[addr] == index[addr]:
+                        scc = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            scc.append(member)
+                            if member == addr:
+                                break
+
+                        for member in scc:
+                            self.routines[member].scc = len(self.sccs)
+                        self.sccs.append(sorted(scc))
+
+    def measure(self):
+        """Depth and stack of every routine, one component at a time."""
+        for n, scc in enumerate(self.sccs):
+            members = [self.routines[addr] for addr in scc]
+
+            recursive = unbounded = False
+            depth, stack, tail = 0, 0, []
+
+            for routine in members:
+                stack = max(stack, routine.local_stack)
+
+                for key in routine.edge_order:
+                    kind, dest_addr = key
+                    sites, site_depth = routine.edges[key]
+
+                    dest = self.routines.get(dest_addr)
+                    if dest is None:
+                        continue
+
+                    if dest.scc == n:
+                        # a loop made of jumps at the routine entry depth
+                        # doesn't use any stack, e.g. the main loop of a game
+                        if kind == CALL or site_depth > 0:
+                            recursive = True
+                        continue
+
+                    if dest.unbounded:
+                        unbounded = True
+                        continue
+
+                    if kind == CALL:
+                        stack = max(stack, site_depth + 2 + dest.stack)
+                        dest_depth = dest.depth + 1
+                    else:
+                        stack = max(stack, site_depth + dest.stack)
+                        dest_depth = dest.depth
+
+                    if dest_depth > depth or not tail:
+                        depth, tail = dest_depth, dest.chain
+
+            for routine in members:
+                routine.recursive = recursive
+                routine.unbounded = recursive or unbounded
+                if routine.unbounded:
+                    routine.depth = routine.stack = None
+                    routine.chain = []
+                else:
+                    routine.depth = depth
+                    routine.stack = stack
+                    routine.chain = [routine.name] + tail
+
+    def edges(self):
+        for addr in self.order:
+            routine = self.routines[addr]
+            for key in routine.edge_order:
+                yield routine, key[0], self.name_of(key[1]), routine.edges[key]
+
+    def to_dot(self):
+        lines = ['digraph G {']
+
+        for addr in self.order:
+            routine = self.routines[addr]
+            lines.append('  %s [label="%s\\n%s bytes"] ;' % (routine.name, routine.name,
+                                                           '?' if routine.unbounded else routine.stack))
+
+        for routine, kind, dest_name, (sites, depth) in self.edges():
+            style = ', style=dashed' if kind == JUMP else ''
+            lines.append('  %s -> %s [weight=%d, label="%d"%s] ;' % (routine.name, dest_name, sites, sites, style))
+
+        lines.append('}')
+
+        return '\n'.join(lines)
+
+    def routine_to_json(self, routine):
+        return {
+            'addr': routine.addr,
+            'local_stack': routine.local_stack,
+            'calls': [self.name_of(dest_addr) for kind, dest_addr in routine.edge_order if kind == CALL],
+            'jumps': [self.name_of(dest_addr) for kind, dest_addr in routine.edge_order if kind == JUMP],
+            'scc': routine.scc,
+            'recursive': routine.recursive,
+            'unbounded': routine.unbounded,
+            'depth': routine.depth,
+            'stack': routine.stack,
+            'chain': routine.chain,
+        }
+
+    def to_json(self):
+        return json.dumps({
+            'routines': dict((self.routines[addr].name, self.routine_to_json(self.routines[addr])) for addr in self.order),
+            'sccs': [[self.name_of(addr) for addr in scc] for scc in self.sccs if len(scc) > 1],
+        }, indent=2, sort_keys=True, separators=(',', ': '))
+
+    def to_table(self):
+        lines = ['%-12s %5s %5s %5s %6s  %s' % ('routine', 'addr', 'calls', 'depth', 'stack', 'longest chain')]
+
+        for addr in self.order:
+            routine = self.routines[addr]
+            calls = sum(1 for kind, dest_addr in routine.edge_order if kind == CALL)
+            if routine.recursive:
+                depth = stack = 'rec'
+            elif routine.unbounded:
+                depth = stack = '?'
+            else:
+                depth, stack = routine.depth, routine.stack
+
+            lines.append('%-12s %04X %5d %5s %6s  %s' % (routine.name, addr, calls, depth, stack, ' > '.join(routine.chain)))
+
+        return '\n'.join(lines)
@@ -17,9 +17,21 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import os
 import sys
 
+from StringIO import StringIO
+
+import archive
+import assembler
 import atari2600
+import callgraph
+import fingerprint
+import resolve
+import search
+import store
+import symbols
+import watch
 
 def smart_int(s):
     if s.startswith('0x'):
@@ -35,32 +47,93 @@ def pair(s):
 
     return symbol, smart_int(value)
 
+# the outputs, written in this order when sent to the same file
+MODES = ('memory_map', 'disassemble', 'call_graph', 'ram_usage', 'addr_info', 'search', 'verify')
+
+def output_path(s):
+    """(mode, path) of an --output, mode is None for all the outputs."""
+    mode, sep, path = s.partition('=')
+    if sep and mode in MODES:
+        return mode, path
+
+    return None, s
+
 def parse_args():
     import argparse
 
     parser = argparse.ArgumentParser(description="Disassemble an Atari 2600 ROM")
 
-    parser.add_argument('romfile', type=argparse.FileType('r'))
+    parser.add_argument('romfile')
+    parser.add_argument('--members', nargs='*', default=['*'])
     parser.add_argument('--loglevel', default='warn', action='store', choices=('debug', 'info', 'warn'))
     parser.add_argument('--org', default=None, type=smart_int)
     parser.add_argument('--code', type=smart_int, nargs='*')
     parser.add_argument('--code_ref', type=smart_int, nargs='*')
     parser.add_argument('--symbol', type=pair, nargs='*')
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument('--memory_map', '-m', default=False, action='store_true')
-    group.add_argument('--call_graph', '-c', default=False, action='store_true')
-    group.add_argument('--disassemble', '-d', default=False, action='store_true')
-    group.add_argument('--addr_info', '-a', default=None, type=smart_int)
-
-    return parser.parse_args()
-
-def main():
-    args = parse_args()
-
-    logging.basicConfig(level=getattr(logging, args.loglevel.upper()),
-                        format='%(levelname)s:%(message)s')
-
-    memory = atari2600.Memory.from_file(args.romfile, args.org)
+    parser.add_argument('--undocumented', default=False, action='store_true',
+                        help='decode the stable undocumented opcodes (LAX, SAX, DCP, SKB...)')
+    parser.add_argument('--strict', default=False, action='store_true',
+                        help='fail on code that cannot be decoded instead of giving up the path')
+    parser.add_argument('--no_resolve', default=False, action='store_true',
+                        help="don't look for the destinations of indirect jumps")
+    parser.add_argument('--symbol_file', nargs='*')
+    parser.add_argument('--symbol_format', default=None, choices=sorted(symbols.FORMATS))
+    parser.add_argument('--export_symbols', default=None)
+    parser.add_argument('--fingerprints', default=None, type=fingerprint.FingerprintIndex,
+                        help='name the routines found in this fingerprint index')
+    parser.add_argument('--learn_fingerprints', default=None, type=fingerprint.FingerprintIndex,
+                        help='add the named routines to this fingerprint index')
+    parser.add_argument('--call_graph_format', default='dot', choices=('dot', 'json', 'table'))
+    parser.add_argument('--store', default=None, help='add the analysis to this SQLite database')
+    parser.add_argument('--where', default=None, choices=('code', 'data'),
+                        help='limit --search to the traced code or to the data')
+    parser.add_argument('--verify', default=False, action='store_true',
+                        help='reassemble the disassembly and compare it with the ROM')
+    parser.add_argument('--output', '-o', default=[], type=output_path, action='append',
+                        help='FILE for all the outputs, or MODE=FILE for one of them, e.g. disassemble=game.s')
+    parser.add_argument('--watch', '-w', default=False, action='store_true')
+    parser.add_argument('--interval', default=0.5, type=float)
+    parser.add_argument('--memory_map', '-m', default=False, action='store_true')
+    parser.add_argument('--call_graph', '-c', default=False, action='store_true')
+    parser.add_argument('--disassemble', '-d', default=False, action='store_true')
+    parser.add_argument('--ram_usage', '-r', default=False, action='store_true')
+    parser.add_argument('--addr_info', '-a', default=[], type=smart_int, action='append')
+    parser.add_argument('--search', '-s', default=None, help="e.g. 'STA WSYNC', 'LDA (*),Y' or 'A9 ?? 85 02'")
+
+    args = parser.parse_args()
+
+    args.outputs = dict((mode, path) for mode, path in args.output if mode is not None)
+    paths = [path for mode, path in args.output if mode is None]
+    if len(paths) > 1:
+        parser.error('more than one --output for all the outputs')
+    args.output = paths[0] if paths else None
+
+    for mode in args.outputs:
+        if not getattr(args, mode):
+            parser.error('--output %s=%s without --%s' % (mode, args.outputs[mode], mode))
+
+    if not has_output(args) and not args.store and not args.learn_fingerprints:
+        parser.error('at least one of the arguments --memory_map/-m --call_graph/-c --disassemble/-d '
+                     '--ram_usage/-r --addr_info/-a --search/-s --verify --store --export_symbols '
+                     '--learn_fingerprints is required')
+
+    if args.search:
+        try:
+            search.parse(args.search)
+        except search.SearchSyntaxError as e:
+            parser.error(str(e))
+
+    if args.watch and archive.is_archive(args.romfile):
+        parser.error('--watch needs a ROM file, not an archive')
+
+    return args
+
+def analyse(args, romfile):
+    memory = atari2600.Memory.from_file(romfile, args.org, undocumented=args.undocumented)
+
+    if args.symbol_file:
+        for path in args.symbol_file:
+            memory.symbols.load(path, args.symbol_format)
 
     if args.symbol:
         for symbol, value in args.symbol:
@@ -88,27 +161,234 @@ def main():
 
     memory.trace_code(starts)
 
-    if args.memory_map:
-        print memory.to_string()
+    if not args.no_resolve:
+        resolve.resolve_indirect(memory)
+
+    for start, fault in sorted(memory.faults.items()):
+        if args.strict:
+            raise fault.error
+
+        logging.warning('%s: gave up tracing from %04X, %s' % (getattr(romfile, 'name', '-'), start, fault.error))
 
-    if args.disassemble:
-        for value, symbol in memory.symbols.items():
-            if value < memory.start:
-                print "%s = $%04X" % (symbol, value)
+    if args.learn_fingerprints:
+        learnt = args.learn_fingerprints.learn(memory, getattr(romfile, 'name', None))
+        logging.info('Learnt %d fingerprints' % learnt)
 
-        print "       * = $%04X" % memory.start
-        print
+    if args.fingerprints:
+        args.fingerprints.identify(memory)
 
-        print '    code'
+    return memory, starts
 
-        memory.dis()
+def disassemble(memory):
+    for value, symbol in memory.symbols.items():
+        if value < memory.start:
+            print "%s = $%04X" % (symbol, value)
 
-    if args.call_graph:
-        memory.call_graph(*starts)
+    print "       * = $%04X" % memory.start
+    print
 
-    if args.addr_info:
-        addr = args.addr_info
-        print hex(addr), memory.addr_label(addr), memory.annotations[addr]
+    print '    code'
+
+    memory.dis()
+
+def listing(memory):
+    """The disassembly, as lines."""
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        disassemble(memory)
+        return sys.stdout.getvalue().splitlines(True)
+    finally:
+        sys.stdout = stdout
+
+def verify(args, memory, lines=None):
+    """Reassemble the disassembly, returning the report of the comparison
+    with the ROM."""
+    if lines is None:
+        lines = listing(memory)
+
+    errors, mismatches = assembler.verify(lines, memory.memory, memory.start, undocumented=args.undocumented)
+
+    return assembler.report(errors, mismatches, lines)
+
+def output(args, memory, starts, modes=MODES, shared=None):
+    """Print the requested outputs among modes. shared keeps what they have
+    in common, when they are printed to different files."""
+    if shared is None:
+        shared = {}
+
+    if args.disassemble and args.verify and 'listing' not in shared:
+        shared['listing'] = listing(memory)
+
+    for mode in modes:
+        if not getattr(args, mode):
+            continue
+
+        if mode == 'memory_map':
+            print memory.to_string()
+
+        elif mode == 'disassemble':
+            if 'listing' in shared:
+                sys.stdout.writelines(shared['listing'])
+            else:
+                disassemble(memory)
+
+        elif mode == 'call_graph':
+            graph = callgraph.CallGraph(memory, starts)
+            print getattr(graph, 'to_' + args.call_graph_format)()
+
+        elif mode == 'ram_usage':
+            print memory.ram_usage()
+
+        elif mode == 'addr_info':
+            for addr in args.addr_info:
+                print hex(addr), memory.addr_label(addr), memory.annotations[addr]
+
+        elif mode == 'search':
+            pattern = search.parse(args.search)
+            routine_of = memory.routine_finder()
+
+            for addr, length in search.SearchIndex(memory).search(pattern, args.where):
+                routine = routine_of(addr)
+                print '%04X  %-8s %s' % (addr, '' if routine is None else memory.addr_label(routine),
+                                         search.describe(memory, addr, length, pattern))
+
+        elif mode == 'verify':
+            print verify(args, memory, shared.get('listing'))
+
+def destinations(args):
+    """[(path, modes)] of the requested outputs, path is None for the
+    standard output."""
+    result = []
+
+    for mode in MODES:
+        if not getattr(args, mode):
+            continue
+
+        path = args.outputs.get(mode, args.output)
+        for dest_path, modes in result:
+            if dest_path == path:
+                modes.append(mode)
+                break
+        else:
+            result.append((path, [mode]))
+
+    return result
+
+def member_path(path, name):
+    """path with {name} replaced by the name of an archive member, creating
+    the directories of the members in subdirectories."""
+    path = path.format(name=name)
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    return path
+
+def render(args, memory, starts, name=None, header=None):
+    """Write the outputs to their destinations. With a name, for archive
+    members, the paths containing {name} are written for this member alone
+    while the other outputs are appended, preceded by header."""
+    if args.export_symbols:
+        path = args.export_symbols if name is None else member_path(args.export_symbols, name)
+        symbols.save(path, memory.labels(), args.symbol_format)
+
+    shared = {}
+    for path, modes in destinations(args):
+        own = name is None or (path is not None and '{name}' in path)
+
+        stdout = sys.stdout
+        if path:
+            if name is not None and own:
+                path = member_path(path, name)
+
+            sys.stdout = open(path, 'w' if own else 'a')
+
+        try:
+            if header and not own:
+                sys.stdout.write(header)
+
+            output(args, memory, starts, modes, shared)
+        finally:
+            if path:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+def has_output(args):
+    return any(getattr(args, mode) for mode in MODES) or bool(args.export_symbols)
+
+def render_archive(args, results):
+    """Disassemble the archive members one by one, sending each output to
+    the file named after the member if its path contains {name}, otherwise
+    one after the other with a header line. The symbols can only be
+    exported to a file per member."""
+    if args.export_symbols and '{name}' not in args.export_symbols:
+        raise RuntimeError('--export_symbols needs {name} in its path for an archive')
+
+    for path, modes in destinations(args):
+        if path and '{name}' not in path:
+            open(path, 'w').close()
+
+    done = failed = 0
+    for name, romfile in archive.open_members(args.romfile, args.members):
+        try:
+            memory, starts = analyse(args, romfile)
+        except Exception as e:
+            logging.error('%s: %s' % (name, e))
+            failed += 1
+            continue
+
+        # the same member name may be found in other archives
+        if results is not None:
+            results.add(args.romfile + '/' + name, memory, starts)
+
+        if has_output(args):
+            render(args, memory, starts, name=archive.member_stem(name),
+                   header='==> %s <==\n' % name)
+
+        done += 1
+
+    logging.info('%d members disassembled, %d failed' % (done, failed))
+
+    if not done and not failed:
+        raise RuntimeError('no member of %s matching %s' % (args.romfile, ' '.join(args.members)))
+
+    if failed:
+        raise RuntimeError('%d of %d archive members failed' % (failed, done + failed))
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper()),
+                        format='%(levelname)s:%(message)s')
+
+    if args.watch:
+        watcher = watch.Watcher(args.romfile,
+                                lambda romfile: analyse(args, romfile),
+                                lambda memory, starts: render(args, memory, starts),
+                                interval=args.interval,
+                                refine=None if args.no_resolve else resolve.resolve_indirect)
+        watcher.run()
+        return
+
+    results = store.Store(args.store) if args.store else None
+
+    try:
+        if archive.is_archive(args.romfile):
+            render_archive(args, results)
+        else:
+            with open(args.romfile, 'rb') as romfile:
+                memory, starts = analyse(args, romfile)
+
+            if results is not None:
+                results.add(args.romfile, memory, starts)
+
+            if has_output(args):
+                render(args, memory, starts)
+    finally:
+        if results is not None:
+            results.close()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,168 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import re
+import sqlite3
+import struct
+
+from operands import *
+
+# operands depending on where the code and the variables are: masked out of
+# the fingerprint, unless they are registers
+ABSOLUTE_MODES = (M_ABS, M_ABSX, M_ABSY, M_ADDR, M_AIND)
+ZERO_PAGE_MODES = (M_ZERO, M_ZERX, M_ZERY, M_INDX, M_INDY)
+
+# shorter routines are too common to tell anything
+MIN_INSTRUCTIONS = 6
+
+GENERATED_LABEL = re.compile(r'^L[0-9A-F]{4}$')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fingerprints (
+    hash INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    instructions INTEGER NOT NULL,
+    source TEXT
+);
+'''
+
+def is_register(addr):
+    """TIA and RIOT registers, at the same address in every game."""
+    return addr < 0x80 or 0x280 <= addr <= 0x297
+
+def routine_instrs(memory, entry, traced=None):
+    """The traced (addr, instruction) pairs of the routine starting at
+    entry, following branches but not calls and jumps, sorted by address.
+    traced is dict(memory.traced_instrs()), if already known."""
+    if traced is None:
+        traced = dict(memory.traced_instrs())
+
+    instrs = {}
+    todo = [entry]
+
+    while todo:
+        addr = todo.pop()
+
+        while addr in traced and addr not in instrs:
+            instr = instrs[addr] = traced[addr]
+            opcode = instr.opcode
+
+            if opcode.src == M_REL:
+                todo.append(addr + opcode.size + instr.src.offset)
+            elif opcode.dst == M_PC and opcode.mnemonic != 'JSR':
+                break
+
+            addr += opcode.size
+
+    return sorted(instrs.items())
+
+def fingerprint(memory, entry, traced=None):
+    """(hash, number of instructions) of a routine. The hash covers the
+    opcodes and the operands, with the layout of the code given by the
+    distance between instructions; addresses in the ROM and in the RAM
+    are masked."""
+    digest = hashlib.sha1()
+
+    instrs = routine_instrs(memory, entry, traced)
+    for addr, instr in instrs:
+        opcode = instr.opcode
+
+        digest.update(struct.pack('<HB', addr - entry, memory[addr]))
+        if opcode.size == 2:
+            value = memory[addr+1]
+            if not (opcode.src in ZERO_PAGE_MODES or opcode.dst in ZERO_PAGE_MODES) or is_register(value):
+                digest.update(chr(value))
+        elif opcode.size == 3:
+            value = memory.get_word(addr+1)
+            if not (opcode.src in ABSOLUTE_MODES or opcode.dst in ABSOLUTE_MODES) or is_register(value):
+                digest.update(struct.pack('<H', value))
+
+    # 63 bits, to fit a SQLite integer
+    return struct.unpack('>Q', digest.digest()[:8])[0] >> 1, len(instrs)
+
+class FingerprintIndex(object):
+    """Persistent fingerprint -> routine name mapping."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def add(self, hash_, name, instructions, source=None):
+        self.db.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)', (hash_, name, instructions, source))
+
+    def lookup(self, hash_):
+        row = self.db.execute('SELECT name FROM fingerprints WHERE hash = ?', (hash_,)).fetchone()
+
+        return row and row[0]
+
+    def learn(self, memory, source=None):
+        """Add the routines of memory having a (not generated) symbol."""
+        learnt = 0
+        traced = dict(memory.traced_instrs())
+
+        for entry in memory.routine_entries():
+            name = memory.symbols.get(entry)
+            if name is None or name == 'START' or GENERATED_LABEL.match(name):
+                continue
+
+            hash_, instructions = fingerprint(memory, entry, traced)
+            if instructions >= MIN_INSTRUCTIONS:
+                self.add(hash_, name, instructions, source)
+                learnt += 1
+
+        self.db.commit()
+
+        return learnt
+
+    def identify(self, memory):
+        """Name the routines of memory found in the index, unless they
+        already have a symbol. Returns the [(addr, name)] found."""
+        found = []
+        used = set(memory.symbols.local.values())
+        traced = dict(memory.traced_instrs())
+
+        for entry in memory.routine_entries():
+            if entry in memory.symbols:
+                continue
+
+            hash_, instructions = fingerprint(memory, entry, traced)
+            if instructions < MIN_INSTRUCTIONS:
+                continue
+
+            name = self.lookup(hash_)
+            if name is None:
+                continue
+
+            # the same library routine linked more than once
+            unique, n = name, 1
+            while unique in used:
+                n += 1
+                unique = '%s_%d' % (name, n)
+
+            used.add(unique)
+            memory.add_symbol(entry, unique)
+            found.append((entry, unique))
+
+            logging.info('%04X is %s' % (entry, unique))
+
+        return found
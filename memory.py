@@ -17,9 +17,12 @@
 
 import sys
 
+from bisect import bisect_left, bisect_right
 from collections import defaultdict, namedtuple
 
+from access import AccessCounters, READ, WRITE, RMW, accesses
 from operands import *
+from symbols import SymbolTable
 
 Opcode = namedtuple('Opcode', 'mnemonic src dst cycles size')
 
@@ -47,9 +50,74 @@ def Op(**kwargs):
 
 Instruction = namedtuple('Instruction', 'opcode src dst')
 
-class UnknownOpcodeError(Exception):
+# decoded instructions by opcode and operand bytes, see Memory.dis_instruction
+INSTRUCTIONS = {}
+MAX_INSTRUCTIONS = 0x10000
+
+# mnemonics showing their register operand, e.g. ASL A, see compile_formatter
+SHOW_REGISTER = 'ADC AND ASL BIT CMP CPX CPY DEC EOR INC JMP LDA LDX LDY LSR ORA ROL ROR SBC STA STX STY'
+
+# operands printing as an empty string
+SILENT_OPERANDS = (RegisterBase, FlagBase, M_NONE)
+
+def compile_formatter(opcode):
+    """(template, render) producing the listing line of an instruction of
+    opcode: template % (label, render(instr, addr, memory)), or just
+    template % label when render is None because the operand is fixed."""
+    template = '%%s %-6s %%s\n' % opcode.mnemonic
+    if opcode.mnemonic in ('RTS', 'RTI'):
+        template += '\n'
+
+    src, dst = opcode.src, opcode.dst
+
+    if hasattr(src, 'to_string'):
+        return template, lambda instr, addr, memory: instr.src.to_string(addr, memory)
+
+    if not issubclass(src, SILENT_OPERANDS):
+        return template, lambda instr, addr, memory: str(instr.src)
+
+    if hasattr(dst, 'to_string'):
+        return template, lambda instr, addr, memory: instr.dst.to_string(addr, memory)
+
+    stringer = repr if opcode.mnemonic in SHOW_REGISTER else str
+
+    if not issubclass(dst, SILENT_OPERANDS):
+        return template, lambda instr, addr, memory: stringer(instr.dst)
+
+    text = stringer(dst())
+    if text == 'A':
+        text = ''
+
+    return template % ('%s', text.replace('%', '%%')), None
+
+FORMATTERS = {}
+
+def formatter(opcode):
+    try:
+        return FORMATTERS[opcode]
+    except KeyError:
+        result = FORMATTERS[opcode] = compile_formatter(opcode)
+        return result
+
+class DecodeError(Exception):
+    def __init__(self, addr, detail):
+        Exception.__init__(self, addr, detail)
+        self.addr = addr
+        self.detail = detail
+
+    def __str__(self):
+        return '%s at addr %04X' % (self.detail, self.addr)
+
+class UnknownOpcodeError(DecodeError):
+    def __str__(self):
+        return 'unknown opcode ' + super(UnknownOpcodeError, self).__str__()
+
+class TruncatedInstructionError(DecodeError):
     def __str__(self):
-        return 'unknown opcode ' + self.message
+        return 'truncated ' + super(TruncatedInstructionError, self).__str__()
+
+# a path given up by Memory.trace_code: tracing from start failed at addr
+Fault = namedtuple('Fault', 'start addr error')
 
 class Ranges(object):
     def __init__(self):
@@ -80,8 +148,38 @@ class Ranges(object):
 
         return False
 
+class Segment(object):
+    """What tracing from a single start added to a Memory, so that it can be undone."""
+
+    def __init__(self, memory, start):
+        self.memory = memory
+        self.start = start
+        self.stop = start
+        self.last = start
+        self.marks = []
+        self.successors = []
+
+    def mark(self, addr, kind):
+        self.memory.trace_marks[addr, kind] += 1
+        self.marks.append((addr, kind))
+
+    def annotate(self, addr, kind):
+        self.memory.annotate(addr, kind)
+        self.mark(addr, kind)
+
+    def add_call(self, from_addr, to_addr):
+        self.memory.add_call(from_addr, to_addr)
+        self.mark(from_addr, 'call')
+
+    def add_jump(self, from_addr, to_addr):
+        self.memory.add_jump(from_addr, to_addr)
+        self.mark(from_addr, 'jump')
+
 class Memory(object):
-    def __init__(self, memory, org, symbols=None):
+    def __init__(self, memory, org, symbols=None, undocumented=False):
+        # table imports this module
+        from table import TABLE, EXTENDED
+
         self.memory = memory
         self.start = org
         self.end = self.start + len(memory)
@@ -90,15 +188,34 @@ class Memory(object):
         self.annotations = defaultdict(set)
         self.calls = {}
         self.jumps = {}
-
-        if symbols is None:
-            self.symbols = {}
-        else:
+        self.segments = {}
+        # traced_instrs(), until the segments change
+        self.instrs_cache = None
+        # start -> Fault, for the paths that couldn't be traced
+        self.faults = {}
+        # JMP (ind) and RTS addr -> destinations found by resolve.Resolver
+        self.dispatches = {}
+        self.access = AccessCounters()
+        self.trace_marks = defaultdict(int)
+        self.opcodes = EXTENDED if undocumented else TABLE
+
+        if isinstance(symbols, SymbolTable):
             self.symbols = symbols.copy()
+        else:
+            self.symbols = SymbolTable(symbols)
+
+    @classmethod
+    def from_file(cls, file_, org, symbols=None, undocumented=False):
+        return cls(file_.read(), org, symbols=symbols, undocumented=undocumented)
 
     @classmethod
-    def from_file(cls, file_, org, symbols=None):
-        return cls(file_.read(), org, symbols=symbols)
+    def from_archive(cls, path, patterns=('*',), *args, **kwargs):
+        """Yield (name, memory) for each member of a zip or tar archive
+        matching the glob patterns, reading one member at a time."""
+        from archive import open_members
+
+        for name, file_ in open_members(path, patterns):
+            yield name, cls.from_file(file_, *args, **kwargs)
 
     def __repr__(self):
         return '<Memory start=%X end=%X, symbols=%d>' % (self.start, self.end, len(self.symbols))
@@ -127,6 +244,16 @@ class Memory(object):
     def add_symbol(self, addr, symbol):
         self.symbols[addr] = symbol
 
+    def labels(self):
+        """Symbols plus the labels generated by tracing, sorted by address."""
+        labels = dict(self.symbols.items())
+
+        for addr, annotations in self.annotations.items():
+            if addr not in labels and self.has_addr(addr) and ('J' in annotations or 'T' in annotations):
+                labels[addr] = 'L%04X' % addr
+
+        return sorted(labels.items())
+
     def add_call(self, from_addr, to_addr):
         self.calls[from_addr] = to_addr
 
@@ -197,184 +324,331 @@ class Memory(object):
 
         return 'UNKNOWN'
 
-    def call_graph(self, *starts):
-        print 'digraph G {'
+    def routine_entries(self):
+        """Sorted addresses of the routines: call and jump destinations and START."""
+        entries = set(addr for addr, annotations in self.annotations.items()
+                      if 'J' in annotations and self.has_addr(addr))
+        entries.update(addr for addr, symbol in self.symbols.items() if symbol == 'START')
 
-        seen_starts = set()
+        return sorted(entries)
 
-        while starts:
-            next_starts = set()
+    def routine_finder(self):
+        """A faster routine_of_addr, valid until the next trace."""
+        entries = self.routine_entries()
 
-            for start in starts:
-                seen_starts.add(start)
+        def routine_of(addr):
+            i = bisect_right(entries, addr)
+            return entries[i-1] if i else None
 
-                start_label = self.addr_label(start)
-                addr = start
-                while not self.addr_is(addr, 'R'):
-                    if self.calls.has_key(addr):
-                        dest_addr = self.calls[addr]
-                        if not dest_addr in seen_starts:
-                            next_starts.add(dest_addr)
-                        print ' ', start_label, '->', self.addr_label(dest_addr), ';'
+        return routine_of
 
-                    addr += 1
+    def traced_instrs(self):
+        """The traced (addr, instruction) pairs, sorted by address."""
+        if self.instrs_cache is not None:
+            return self.instrs_cache
 
-                if self.addr_is(addr, 'M'):
-                    dest_addr = self.jumps[addr]
-                    if not dest_addr in seen_starts:
-                        next_starts.add(dest_addr)
-                    print ' ', start_label, '->', self.addr_label(dest_addr), ';'
+        instrs = {}
 
-            starts = next_starts
+        for start, segment in self.segments.items():
+            addr = start
+            while addr <= segment.last and addr not in instrs:
+                instr = instrs[addr] = self.dis_instruction(addr)
+                addr += instr.opcode.size
+
+        self.instrs_cache = sorted(instrs.items())
+        return self.instrs_cache
+
+    def basic_blocks(self, instrs=None):
+        """(start, stop) of the traced basic blocks, from traced_instrs()."""
+        if instrs is None:
+            instrs = self.traced_instrs()
+
+        leaders = set(self.segments)
+        for addr, instr in instrs:
+            if instr.opcode.src == M_REL:
+                leaders.add(addr + instr.opcode.size + instr.src.offset)
+
+        blocks = []
+        start = None
+        for addr, instr in instrs:
+            if start is not None and (addr in leaders or addr != stop):
+                blocks.append((start, stop))
+                start = None
 
-        print '}'
+            if start is None:
+                start = addr
+            stop = addr + instr.opcode.size
+
+            if instr.opcode.src == M_REL or (instr.opcode.dst == M_PC and instr.opcode.mnemonic != 'JSR'):
+                blocks.append((start, stop))
+                start = None
+
+        if start is not None:
+            blocks.append((start, stop))
+
+        return blocks
+
+    def call_graph(self, *starts):
+        from callgraph import CallGraph
+
+        print CallGraph(self, starts).to_dot()
 
     def trace_code(self, starts):
-        seen_starts = set()
+        """Trace the code reachable from starts. A path running into bytes
+        that can't be decoded is given up and recorded in faults, keeping
+        what the other paths found."""
+        seen_starts = set(self.segments)
+        seen_starts.update(self.faults)
 
         while starts:
             next_starts = set()
 
             for start in starts:
+                if start in seen_starts:
+                    continue
+
                 seen_starts.add(start)
 
-                for addr, instr in self.instrs(start):
-                    # memory access
-                    if instr.opcode.src in (M_ABS, M_ADDR, M_ABSX, M_ABSY):
-                        self.annotate(instr.src.addr, 'r')
-
-                    if instr.opcode.dst in (M_ABS, M_ADDR, M_ABSX, M_ABSY):
-                        self.annotate(instr.dst.addr, 'w')
-
-                    # jumps and branches
-                    if instr.opcode.src == M_REL:  # branches
-                        self.annotate(addr, 'B')
-                        dest_addr = addr + instr.opcode.size + instr.src.offset
-                        self.annotate(dest_addr, 'T')
-                        if self.has_addr(dest_addr) and not dest_addr in seen_starts:
-                            next_starts.add(dest_addr)
-                    elif instr.opcode.dst == M_PC:
-                        if instr.opcode.mnemonic == 'JSR':
-                            self.annotate(instr.src.addr, 'J')
-                            if self.has_addr(instr.src.addr) and not instr.src.addr in seen_starts:
-                                next_starts.add(instr.src.addr)
-                            self.add_call(addr, instr.src.addr)
-                        elif instr.opcode.mnemonic == 'JMP':
-                            self.annotate(addr, 'R')
-
-                            if instr.opcode.src != M_AIND:
-                                self.annotate(addr, 'M')
-
-                                self.annotate(instr.src.addr, 'J')
-                                if self.has_addr(instr.src.addr) and not instr.src.addr in seen_starts:
-                                    next_starts.add(instr.src.addr)
-                                self.add_jump(addr, instr.src.addr)
-
-                            break
-                        else:
-                            if instr.opcode.mnemonic in ('RTS', 'RTI'):
-                                self.annotate(addr, 'R')
-
-                            break
-
-                self.add_executable_range(start, addr)
+                try:
+                    segment = self.trace_segment(start)
+                except DecodeError as e:
+                    self.quarantine(start, e)
+                    continue
+
+                next_starts.update(dest_addr for dest_addr in segment.successors
+                                   if self.has_addr(dest_addr) and not dest_addr in seen_starts)
 
             starts = next_starts
 
-    def dis(self):
-        addr = self.start
-        while addr < self.end:
-            instr = None
-            for addr, instr in self.instrs(addr, check_memory_type=True):
-                if self.symbols.has_key(addr):
-                    print '%s' % self.symbols[addr],
-                elif 'T' in self.annotations[addr] or 'J' in self.annotations[addr]:
-                    print 'L%04X ' % addr,
+    def trace_segment(self, start):
+        self.instrs_cache = None
+        segment = self.segments[start] = Segment(self, start)
+
+        addr = start
+        for addr, instr in self.instrs(start):
+            segment.last, segment.stop = addr, addr + instr.opcode.size
+
+            # memory access
+            self.access.count(addr, instr)
+            segment.mark(addr, 'access')
+
+            for data_addr, kind in accesses(instr):
+                if kind in (READ, RMW):
+                    segment.annotate(data_addr, 'r')
+                if kind in (WRITE, RMW):
+                    segment.annotate(data_addr, 'w')
+
+            if instr.opcode.src == M_ADDR:
+                segment.annotate(instr.src.addr, 'r')
+
+            # jumps and branches
+            if instr.opcode.src == M_REL:  # branches
+                segment.annotate(addr, 'B')
+                dest_addr = addr + instr.opcode.size + instr.src.offset
+                segment.annotate(dest_addr, 'T')
+                segment.successors.append(dest_addr)
+            elif instr.opcode.dst == M_PC:
+                if instr.opcode.mnemonic == 'JSR':
+                    segment.annotate(instr.src.addr, 'J')
+                    segment.successors.append(instr.src.addr)
+                    segment.add_call(addr, instr.src.addr)
+                elif instr.opcode.mnemonic == 'JMP':
+                    segment.annotate(addr, 'R')
+
+                    if instr.opcode.src != M_AIND:
+                        segment.annotate(addr, 'M')
+
+                        segment.annotate(instr.src.addr, 'J')
+                        segment.successors.append(instr.src.addr)
+                        segment.add_jump(addr, instr.src.addr)
+
+                    break
                 else:
-                    print '      ',
+                    if instr.opcode.mnemonic in ('RTS', 'RTI'):
+                        segment.annotate(addr, 'R')
 
-                print instr.opcode.mnemonic, '  ',
+                    break
 
-                try:
-                    instr.src.to_string
-                except AttributeError:
-                    src = str(instr.src)
-                else:
-                    src = instr.src.to_string(addr, self)
+        self.add_executable_range(start, addr)
+
+        return segment
+
+    def add_dispatch(self, site, targets):
+        """Record the destinations of the JMP (ind) or RTS at site, found by
+        resolve.Resolver, as successors of the segments ending there."""
+        self.dispatches[site] = targets
+
+        for segment in self.segments.values():
+            if segment.last != site:
+                continue
+
+            for target in sorted(targets):
+                if target not in segment.successors:
+                    segment.annotate(target, 'J')
+                    segment.successors.append(target)
+
+    def quarantine(self, start, error):
+        self.forget_segments([start])
+        self.faults[start] = Fault(start, error.addr, error)
+
+    def faults_touching(self, addrs):
+        """Starts of the faults whose path contains any of the (sorted) addrs."""
+        touched = set()
+
+        for start, fault in self.faults.items():
+            i = bisect_left(addrs, start)
+            if i < len(addrs) and addrs[i] < fault.addr + 3:
+                touched.add(start)
+
+        return touched
+
+    def segments_touching(self, addrs):
+        """Starts of the traced segments containing any of the (sorted) addrs."""
+        touched = set()
+
+        for start, segment in self.segments.items():
+            i = bisect_left(addrs, start)
+            if i < len(addrs) and addrs[i] < segment.stop:
+                touched.add(start)
 
-                if src:
-                    print src,
+        return touched
+
+    def forget_segments(self, starts):
+        """Undo what tracing the given segments added to the memory."""
+        self.instrs_cache = None
+        for start in starts:
+            segment = self.segments.pop(start)
+
+            for addr, kind in segment.marks:
+                key = addr, kind
+                self.trace_marks[key] -= 1
+                if self.trace_marks[key]:
+                    continue
+
+                del self.trace_marks[key]
+                if kind == 'access':
+                    self.access.forget(addr)
+                elif kind == 'call':
+                    del self.calls[addr]
+                elif kind == 'jump':
+                    del self.jumps[addr]
                 else:
-                    if instr.opcode.mnemonic in 'ADC AND ASL BIT CMP CPX CPY DEC EOR INC JMP LDA LDX LDY LSR ORA ROL ROR SBC STA STX STY':
-                        stringer = repr
-                    else:
-                        stringer = str
+                    self.annotations[addr].discard(kind)
 
-                    try:
-                        instr.dst.to_string
-                    except AttributeError:
-                        dst = stringer(instr.dst)
-                        if dst == 'A':
-                            dst = ''
-                    else:
-                        dst = instr.dst.to_string(addr, self)
+        self.executable_ranges = Ranges()
+        for start, segment in sorted(self.segments.items()):
+            self.add_executable_range(start, segment.last)
 
-                    print dst,
+    def reachable_segments(self, starts):
+        seen = set()
+        todo = [start for start in starts if start in self.segments]
 
-                print
+        while todo:
+            start = todo.pop()
+            if start in seen:
+                continue
 
-                if instr.opcode.mnemonic in ('RTS', 'RTI'):
-                    print
+            seen.add(start)
+            todo.extend(dest_addr for dest_addr in self.segments[start].successors
+                        if dest_addr in self.segments and dest_addr not in seen)
 
-            if instr:
-                addr += instr.opcode.size
+        return seen
+
+    def executable_mask(self):
+        """One byte per address, non zero where is_addr_executable."""
+        mask = bytearray(len(self.memory))
 
+        for start, end in self.executable_ranges:
+            start = max(start, self.start) - self.start
+            end = min(end, self.end - 1) - self.start
+            if end >= start:
+                mask[start:end+1] = '\x01' * (end + 1 - start)
 
-            bytes_on_current_line = 0
-            while addr < self.end and not self.is_addr_executable(addr):
-                annotations = self.annotations[addr]
+        return mask
 
-                if '*' in annotations:
-                    if bytes_on_current_line > 0:
-                        bytes_on_current_line = 0
-                        print
+    def dis(self):
+        write = sys.stdout.write
+        symbols = self.symbols
+        annotations = self.annotations
+        executable = self.executable_mask()
+
+        addr = self.start
+        while addr < self.end:
+            while addr < self.end and executable[addr - self.start]:
+                instr = self.dis_instruction(addr)
+
+                if addr in symbols:
+                    label = symbols[addr]
+                elif 'T' in annotations.get(addr, ()) or 'J' in annotations.get(addr, ()):
+                    label = 'L%04X ' % addr
+                else:
+                    label = '      '
 
-                    print 'L%04X ' % addr, '.word', self.addr_label(self.get_word(addr))
+                template, render = formatter(instr.opcode)
+                if render is None:
+                    write(template % label)
+                else:
+                    write(template % (label, render(instr, addr, self)))
+
+                addr += instr.opcode.size
+
+            head = None
+            byts = []
+            while addr < self.end and not executable[addr - self.start]:
+                ann = annotations.get(addr, ())
+
+                if '*' in ann:
+                    if byts:
+                        write('%s %s\n' % (head, ' , '.join(byts)))
+                        byts = []
+
+                    write('L%04X  .word %s\n' % (addr, self.addr_label(self.get_word(addr))))
                     addr += 2
 
                     continue
 
-                if 'r' in annotations or 'w' in annotations:
-                    if bytes_on_current_line > 0:
-                        bytes_on_current_line = 0
-                        print
+                if 'r' in ann or 'w' in ann:
+                    if byts:
+                        write('%s %s\n' % (head, ' , '.join(byts)))
+                        byts = []
 
-                    print 'L%04X  .byt' % addr,
+                    head = 'L%04X  .byt' % addr
                 else:
-                    if bytes_on_current_line > 16:
-                        print
-                        bytes_on_current_line = 0
+                    if len(byts) > 16:
+                        write('%s %s\n' % (head, ' , '.join(byts)))
+                        byts = []
 
-                    if bytes_on_current_line == 0:
-                        print '       .byt',
-                    else:
-                        print ',',
+                    if not byts:
+                        head = '       .byt'
 
-                print '$%02X' % self[addr],
+                byts.append('$%02X' % self[addr])
 
                 addr += 1
-                bytes_on_current_line += 1
 
-            if bytes_on_current_line > 0:
-                print
+            if byts:
+                write('%s %s\n' % (head, ' , '.join(byts)))
 
     def dis_instruction(self, addr):
-        from table import TABLE
+        byte = self[addr]
+        try:
+            opcode = self.opcodes[byte]
+        except KeyError:
+            raise UnknownOpcodeError(addr, '%02X' % byte)
+
+        if addr + opcode.size > self.end:
+            raise TruncatedInstructionError(addr, opcode.mnemonic)
+
+        if opcode.size == 1:
+            key = byte
+        elif opcode.size == 2:
+            key = byte | self[addr+1] << 8
+        else:
+            key = byte | self.get_word(addr+1) << 8
 
         try:
-            opcode = TABLE[self[addr]]
+            return INSTRUCTIONS[key]
         except KeyError:
-            raise UnknownOpcodeError('%02X at addr %04X' % (self[addr], addr))
+            pass
 
         kwargs = {}
 
@@ -387,7 +661,11 @@ class Memory(object):
         elif addr_mode_in(opcode, M_ZERO, M_ZERX, M_ZERY):
             kwargs['addr'] = self[addr+1]
 
-        return Instruction(opcode=opcode, src=opcode.src(**kwargs), dst=opcode.dst(**kwargs))
+        if len(INSTRUCTIONS) >= MAX_INSTRUCTIONS:
+            INSTRUCTIONS.clear()
+
+        instr = INSTRUCTIONS[key] = Instruction(opcode=opcode, src=opcode.src(**kwargs), dst=opcode.dst(**kwargs))
+        return instr
 
     def instrs(self, addr, check_memory_type=False):
         if addr is None:
@@ -15,10 +15,47 @@
 
 # -*- coding: utf-8 -*-
 
-class RegisterBase(object):
+import re
+
+# operands are shared by all the instructions having the same one, see Operand
+INTERNED = {}
+
+class Operand(object):
+    """Base of the addressing modes.
+
+    Operands are interned, so they must not be modified: M_IMM(immed=5) is
+    always the same object, and the ones without a value (registers, flags,
+    M_NONE) are singletons. field names the keyword argument holding the
+    value.
+
+    Interning changes the equality of the operands having a value, and of
+    the flags: they used to compare by identity, so M_IMM(immed=5) ==
+    M_IMM(immed=5) was False, it is now True (same mode and value). The
+    registers and M_NONE compare as before."""
+    __slots__ = ()
+    field = None
+
+    def __new__(cls, **kwargs):
+        value = kwargs[cls.field] if cls.field else None
+
+        try:
+            return INTERNED[cls, value]
+        except KeyError:
+            self = INTERNED[cls, value] = object.__new__(cls)
+            if cls.field:
+                self.setup(value)
+
+            return self
+
     def __init__(self, **kwargs):
         pass
 
+    def setup(self, value):
+        setattr(self, self.field, value)
+
+class RegisterBase(Operand):
+    __slots__ = ()
+
     def __repr__(self):
         return self.name
 
@@ -29,26 +66,31 @@ class RegisterBase(object):
         return isinstance(other, RegisterBase) and self.name == other.name
 
 class M_AC(RegisterBase):
+    __slots__ = ()
     name = 'A'
 
 class M_XR(RegisterBase):
+    __slots__ = ()
     name = 'X'
 
 class M_YR(RegisterBase):
+    __slots__ = ()
     name = 'Y'
 
 class M_PC(RegisterBase):
+    __slots__ = ()
     name = 'PC'
 
 class M_SP(RegisterBase):
+    __slots__ = ()
     name = 'SP'
 
 class M_SR(RegisterBase):
+    __slots__ = ()
     name = 'SR'
 
-class FlagBase(object):
-    def __init__(self, **kwargs):
-        pass
+class FlagBase(Operand):
+    __slots__ = ()
 
     def __repr__(self):
         return self.name
@@ -57,20 +99,24 @@ class FlagBase(object):
         return ''
 
 class M_FC(FlagBase):
+    __slots__ = ()
     name = 'C'
 
 class M_FD(FlagBase):
+    __slots__ = ()
     name = 'D'
 
 class M_FI(FlagBase):
+    __slots__ = ()
     name = 'I'
 
 class M_FV(FlagBase):
+    __slots__ = ()
     name = 'V'
 
-class M_IMM(object):
-    def __init__(self, **kwargs):
-        self.immed = kwargs['immed']
+class M_IMM(Operand):
+    __slots__ = ('immed',)
+    field = 'immed'
 
     def __repr__(self):
         return str(self)
@@ -78,9 +124,9 @@ class M_IMM(object):
     def __str__(self):
         return '#$%02X' % self.immed
 
-class M_INDX(object):
-    def __init__(self, **kwargs):
-        self.offset = kwargs['offset']
+class M_INDX(Operand):
+    __slots__ = ('offset',)
+    field = 'offset'
 
     def __repr__(self):
         return str(self)
@@ -88,9 +134,9 @@ class M_INDX(object):
     def __str__(self):
         return '($%02X, X)' % self.offset
 
-class M_INDY(object):
-    def __init__(self, **kwargs):
-        self.offset = kwargs['offset']
+class M_INDY(Operand):
+    __slots__ = ('offset',)
+    field = 'offset'
 
     def __repr__(self):
         return str(self)
@@ -98,9 +144,8 @@ class M_INDY(object):
     def __str__(self):
         return '($%02X),Y' % self.offset
 
-class M_NONE(object):
-    def __init__(self, **kwargs):
-        pass
+class M_NONE(Operand):
+    __slots__ = ()
 
     def __eq__(self, other):
         return isinstance(other, M_NONE)
@@ -111,12 +156,15 @@ class M_NONE(object):
     def __str__(self):
         return ''
 
-class M_REL(object):
-    def __init__(self, **kwargs):
-        self.offset = kwargs['offset']
+class M_REL(Operand):
+    __slots__ = ('offset',)
+    field = 'offset'
+
+    def setup(self, offset):
+        if offset >= 128:
+            offset -= 256
 
-        if self.offset >= 128:
-            self.offset -= 256
+        self.offset = offset
 
     def __repr__(self):
         return '.%+d' % self.offset
@@ -125,9 +173,9 @@ class M_REL(object):
         addr += self.offset + 2
         return memory.addr_label(addr)
 
-class AddrBase(object):
-    def __init__(self, **kwargs):
-        self.addr = kwargs['addr']
+class AddrBase(Operand):
+    __slots__ = ('addr',)
+    field = 'addr'
 
     def __repr__(self):
         fmt = '$%%0%dX' % self.size
@@ -138,9 +186,11 @@ class AddrBase(object):
         return memory.addr_label(self.addr, size=self.size)
 
 class M_ABS(AddrBase):
+    __slots__ = ()
     size = 4
 
 class M_ABSX(AddrBase):
+    __slots__ = ()
     size = 4
 
     def __repr__(self):
@@ -154,6 +204,7 @@ class M_ABSX(AddrBase):
         return s + ',X'
 
 class M_ABSY(AddrBase):
+    __slots__ = ()
     size = 4
 
     def __repr__(self):
@@ -167,18 +218,22 @@ class M_ABSY(AddrBase):
         return s + ',Y'
 
 class M_ADDR(AddrBase):
+    __slots__ = ()
     size = 4
 
 class M_ZERO(AddrBase):
+    __slots__ = ()
     size = 2
 
 class M_ZERX(AddrBase):
+    __slots__ = ()
     size = 2
 
     def to_string(self, addr, memory):
         return super(M_ZERX, self).to_string(addr, memory) + ',X'
 
 class M_ZERY(AddrBase):
+    __slots__ = ()
     size = 2
 
     def to_string(self, addr, memory):
@@ -186,7 +241,30 @@ class M_ZERY(AddrBase):
 
 class M_AIND(AddrBase):
     """JMP ($00A2)"""
+    __slots__ = ()
     size = 4
 
     def to_string(self, addr, memory):
         return '(%s)' % super(M_AIND, self).to_string(addr, memory)
+
+# operand syntax in the listings -> addressing modes, for search.py and
+# assembler.py
+OPERAND_SYNTAX = (
+    (re.compile(r'^#(.+)$'), (M_IMM,)),
+    (re.compile(r'^\((.+),\s*X\)$', re.I), (M_INDX,)),
+    (re.compile(r'^\((.+)\),\s*Y$', re.I), (M_INDY,)),
+    (re.compile(r'^\((.+)\)$'), (M_AIND,)),
+    (re.compile(r'^(.+),\s*X$', re.I), (M_ZERX, M_ABSX)),
+    (re.compile(r'^(.+),\s*Y$', re.I), (M_ZERY, M_ABSY)),
+    (re.compile(r'^(.+)$'), (M_ZERO, M_ABS, M_ADDR, M_REL)),
+)
+
+VALUE_MODES = (M_IMM, M_INDX, M_INDY, M_AIND, M_ZERX, M_ABSX, M_ZERY, M_ABSY, M_ZERO, M_ABS, M_ADDR, M_REL)
+
+def operand_mode(opcode):
+    """The addressing mode of the operand of opcode, None if it has none."""
+    for mode in (opcode.src, opcode.dst):
+        if mode in VALUE_MODES:
+            return mode
+
+    return None
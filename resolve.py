@@ -0,0 +1,388 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import logging
+
+from operands import *
+
+# Values of A, X, Y, the zero page and the bytes pushed on the stack are
+# either TOP (unknown), a frozenset of at most MAX_VALUES bytes, or a Table:
+# a byte read from a ROM table with an unknown index.
+
+TOP = None
+MAX_VALUES = 16
+MAX_STACK = 16
+
+# entries scanned in a table indexed by an unknown value
+MAX_TABLE = 128
+
+class Table(tuple):
+    """ROM table read with an unknown index: (base addr,)."""
+
+    @property
+    def base(self):
+        return self[0]
+
+def const(*values):
+    return frozenset(value & 0xff for value in values)
+
+def join(a, b):
+    if a == b:
+        return a
+
+    if isinstance(a, frozenset) and isinstance(b, frozenset):
+        union = a | b
+        if len(union) <= MAX_VALUES:
+            return union
+
+    return TOP
+
+def apply(value, f):
+    if isinstance(value, frozenset):
+        return const(*[f(v) for v in value])
+
+    return TOP
+
+def combine(a, b, f):
+    if isinstance(a, frozenset) and isinstance(b, frozenset) and len(a) * len(b) <= MAX_VALUES:
+        return const(*[f(x, y) for x in a for y in b])
+
+    return TOP
+
+class State(object):
+    """Abstract values at some point of the code. values maps 'A', 'X', 'Y'
+    and zero page addresses to their value, missing means TOP. stack is a
+    tuple of the values pushed since the routine entry, None if unknown."""
+
+    def __init__(self, values=None, stack=()):
+        self.values = values or {}
+        self.stack = stack
+
+    def copy(self):
+        return State(dict(self.values), self.stack)
+
+    def __eq__(self, other):
+        return self.values == other.values and self.stack == other.stack
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, key):
+        return self.values.get(key, TOP)
+
+    def set(self, key, value):
+        if value is TOP:
+            self.values.pop(key, None)
+        else:
+            self.values[key] = value
+
+    def clobber_zero_page(self):
+        for key in [key for key in self.values if not isinstance(key, str)]:
+            del self.values[key]
+
+    def push(self, value):
+        if self.stack is not None:
+            self.stack = (self.stack + (value,))[-MAX_STACK:]
+
+    def pull(self):
+        if not self.stack:
+            # unknown, or pulling what the caller pushed
+            self.stack = None
+            return TOP
+
+        value, self.stack = self.stack[-1], self.stack[:-1]
+        return value
+
+    def join(self, other):
+        values = {}
+        for key, value in self.values.items():
+            if key in other.values:
+                joined = join(value, other.values[key])
+                if joined is not TOP:
+                    values[key] = joined
+
+        if self.stack is None or other.stack is None or len(self.stack) != len(other.stack):
+            stack = None
+        else:
+            stack = tuple(join(a, b) for a, b in zip(self.stack, other.stack))
+
+        return State(values, stack)
+
+REGISTERS = {M_AC: 'A', M_XR: 'X', M_YR: 'Y'}
+
+class Resolver(object):
+    """Find the destinations of indirect jumps (JMP (ind)) and of RTS used
+    as a dispatcher (PHA, PHA, RTS) by propagating constants and small sets
+    of values over the traced code. The destinations are traced, and the
+    analysis resumed on the new code, until nothing new is found.
+
+    Blocks are processed from a worklist, each again only when the state at
+    its entry grows; states can only grow a bounded number of times."""
+
+    def __init__(self, memory):
+        self.memory = memory
+
+        self.instrs = {}
+        self.decoded = set()
+        self.blocks = {}
+        self.entry_states = {}
+        self.targets = {}
+
+    def run(self):
+        memory = self.memory
+
+        while True:
+            changed = self.update_blocks()
+            self.propagate(changed)
+
+            new = set()
+            for site, targets in self.targets.items():
+                memory.add_dispatch(site, targets)
+                new.update(target for target in targets
+                           if target not in memory.segments and target not in memory.faults)
+
+            if not new:
+                break
+
+            logging.info('Resolved indirect jumps to %s' % ', '.join('%04X' % target for target in sorted(new)))
+            memory.trace_code(new)
+
+        return self.targets
+
+    def update_blocks(self):
+        """Decode the newly traced code and split it in blocks. Returns the
+        starts of the blocks to (re)process."""
+        memory = self.memory
+
+        for start, segment in memory.segments.items():
+            if start in self.decoded:
+                continue
+
+            self.decoded.add(start)
+            addr = start
+            while addr <= segment.last and addr not in self.instrs:
+                instr = self.instrs[addr] = memory.dis_instruction(addr)
+                addr += instr.opcode.size
+
+        blocks = dict(memory.basic_blocks(sorted(self.instrs.items())))
+        changed = set(start for start, stop in blocks.items() if self.blocks.get(start) != stop)
+        self.blocks = blocks
+
+        for entry in memory.routine_entries():
+            if entry in blocks and entry not in self.entry_states:
+                self.entry_states[entry] = State()
+                changed.add(entry)
+
+        # code reached in ways we don't know about
+        reached = set()
+        for start in blocks:
+            reached.update(self.successors(start))
+        for start in blocks:
+            if start not in reached and start not in self.entry_states:
+                self.entry_states[start] = State()
+                changed.add(start)
+
+        return set(start for start in changed if start in self.entry_states)
+
+    def successors(self, start):
+        stop = self.blocks[start]
+        addr = start
+        while addr + self.instrs[addr].opcode.size < stop:
+            addr += self.instrs[addr].opcode.size
+
+        instr = self.instrs[addr]
+        opcode = instr.opcode
+
+        if opcode.src == M_REL:
+            return [stop, stop + instr.src.offset]
+        elif opcode.dst == M_PC and opcode.mnemonic != 'JSR':
+            if opcode.mnemonic == 'JMP' and opcode.src == M_ADDR:
+                return [instr.src.addr]
+            return []
+        else:
+            return [stop]
+
+    def propagate(self, todo):
+        todo = set(todo)
+
+        while todo:
+            start = todo.pop()
+
+            state = self.entry_states[start].copy()
+            addr = start
+            stop = self.blocks[start]
+            while addr < stop:
+                instr = self.instrs[addr]
+                self.step(addr, instr, state)
+                addr += instr.opcode.size
+
+            for dest in self.successors(start):
+                if dest not in self.blocks:
+                    continue
+
+                if dest in self.entry_states:
+                    joined = self.entry_states[dest].join(state)
+                    if joined == self.entry_states[dest]:
+                        continue
+                else:
+                    joined = state.copy()
+
+                self.entry_states[dest] = joined
+                todo.add(dest)
+
+    def read(self, mode, operand, state):
+        """Value of a source operand."""
+        memory = self.memory
+
+        if mode in REGISTERS:
+            return state.get(REGISTERS[mode])
+        elif mode == M_IMM:
+            return const(operand.immed)
+        elif mode == M_ZERO:
+            return state.get(operand.addr)
+        elif mode in (M_ZERX, M_ZERY):
+            index = state.get('X' if mode == M_ZERX else 'Y')
+            if isinstance(index, frozenset) and len(index) == 1:
+                return state.get((operand.addr + iter(index).next()) & 0xff)
+        elif mode == M_ABS:
+            if memory.has_addr(operand.addr):
+                return const(memory[operand.addr])
+            elif operand.addr < 0x100:
+                return state.get(operand.addr)
+        elif mode in (M_ABSX, M_ABSY) and memory.has_addr(operand.addr):
+            index = state.get('X' if mode == M_ABSX else 'Y')
+            if isinstance(index, frozenset):
+                addrs = [operand.addr + i for i in index]
+                if all(memory.has_addr(addr) for addr in addrs):
+                    return const(*[memory[addr] for addr in addrs])
+            else:
+                return Table((operand.addr,))
+
+        return TOP
+
+    def write(self, mode, operand, state, value):
+        """Store value in a destination operand."""
+        if mode in REGISTERS:
+            state.set(REGISTERS[mode], value)
+        elif mode == M_ZERO or (mode == M_ABS and operand.addr < 0x100):
+            state.set(operand.addr, value)
+        elif mode in (M_ZERX, M_ZERY):
+            index = state.get('X' if mode == M_ZERX else 'Y')
+            if isinstance(index, frozenset) and len(index) == 1:
+                state.set((operand.addr + iter(index).next()) & 0xff, value)
+            else:
+                state.clobber_zero_page()
+        elif mode in (M_INDX, M_INDY, M_ABSX, M_ABSY):
+            state.clobber_zero_page()
+
+    def step(self, addr, instr, state):
+        opcode = instr.opcode
+        mnemonic = opcode.mnemonic
+
+        if mnemonic in ('LDA', 'LDX', 'LDY', 'TAX', 'TAY', 'TXA', 'TYA', 'STA', 'STX', 'STY'):
+            self.write(opcode.dst, instr.dst, state, self.read(opcode.src, instr.src, state))
+        elif mnemonic in ('INX', 'INY', 'INC'):
+            self.write(opcode.dst, instr.dst, state, apply(self.read(opcode.src, instr.src, state), lambda v: v + 1))
+        elif mnemonic in ('DEX', 'DEY', 'DEC'):
+            self.write(opcode.dst, instr.dst, state, apply(self.read(opcode.src, instr.src, state), lambda v: v - 1))
+        elif mnemonic == 'ASL':
+            self.write(opcode.dst, instr.dst, state, apply(self.read(opcode.src, instr.src, state), lambda v: v << 1))
+        elif mnemonic == 'LSR':
+            self.write(opcode.dst, instr.dst, state, apply(self.read(opcode.src, instr.src, state), lambda v: v >> 1))
+        elif mnemonic == 'LAX':
+            value = self.read(opcode.src, instr.src, state)
+            state.set('A', value)
+            state.set('X', value)
+        elif mnemonic in ('SLO', 'RLA', 'SRE', 'RRA', 'ISB'):
+            # read-modify-write, then combined with A
+            self.write(opcode.dst, instr.dst, state, TOP)
+            state.set('A', TOP)
+        elif mnemonic in ('AND', 'ORA', 'EOR'):
+            f = {'AND': lambda a, b: a & b, 'ORA': lambda a, b: a | b, 'EOR': lambda a, b: a ^ b}[mnemonic]
+            state.set('A', combine(state.get('A'), self.read(opcode.src, instr.src, state), f))
+        elif mnemonic == 'PHA':
+            state.push(state.get('A'))
+        elif mnemonic == 'PHP':
+            state.push(TOP)
+        elif mnemonic == 'PLA':
+            state.set('A', state.pull())
+        elif mnemonic == 'PLP':
+            state.pull()
+        elif mnemonic == 'TSX':
+            state.set('X', TOP)
+        elif mnemonic == 'TXS':
+            state.stack = ()
+        elif mnemonic == 'JSR':
+            state.values = {}
+        elif mnemonic == 'RTS':
+            if state.stack and len(state.stack) >= 2:
+                self.dispatch(addr, state.stack[-2], state.stack[-1], 1)
+        elif opcode.src == M_AIND:
+            self.jump_indirect(addr, instr.src.addr, state)
+        elif opcode.dst in REGISTERS or opcode.dst in (M_ZERO, M_ZERX, M_ZERY, M_ABS, M_ABSX, M_ABSY, M_INDX, M_INDY):
+            self.write(opcode.dst, instr.dst, state, TOP)
+
+    def jump_indirect(self, addr, pointer, state):
+        memory = self.memory
+
+        if memory.has_addr(pointer) and memory.has_addr(pointer + 1):
+            self.add_targets(addr, [memory.get_word(pointer)])
+        elif pointer < 0x100:
+            self.dispatch(addr, state.get((pointer + 1) & 0xff), state.get(pointer), 0)
+
+    def dispatch(self, addr, hi, lo, offset):
+        """Jump to (hi << 8 | lo) + offset."""
+        if isinstance(hi, frozenset) and isinstance(lo, frozenset):
+            self.add_targets(addr, [(h << 8 | l) + offset for h in hi for l in lo])
+        elif isinstance(hi, Table) and isinstance(lo, Table):
+            self.add_targets(addr, self.scan_tables(hi.base, lo.base, offset))
+
+    def scan_tables(self, hi_base, lo_base, offset):
+        """Destinations from a pair of tables, read up to the first entry
+        that doesn't look like code or runs into code or the other table."""
+        memory = self.memory
+
+        # a table of words read with an even index
+        stride = 2 if hi_base == lo_base + 1 else 1
+
+        targets = []
+        for i in xrange(0, MAX_TABLE * stride, stride):
+            hi_addr, lo_addr = hi_base + i, lo_base + i
+            if i and (hi_addr == lo_base or lo_addr == hi_base):
+                break
+
+            if not (memory.has_addr(hi_addr) and memory.has_addr(lo_addr)):
+                break
+
+            if memory.is_addr_executable(hi_addr) or memory.is_addr_executable(lo_addr):
+                break
+
+            target = (memory[hi_addr] << 8 | memory[lo_addr]) + offset
+            if not memory.has_addr(target) or memory[target] not in memory.opcodes:
+                break
+
+            targets.append(target)
+
+        return targets
+
+    def add_targets(self, addr, targets):
+        targets = set(target for target in targets if self.memory.has_addr(target))
+        if targets:
+            self.targets.setdefault(addr, set()).update(targets)
+
+def resolve_indirect(memory):
+    return Resolver(memory).run()
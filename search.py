@@ -0,0 +1,463 @@
+#! /usr/bin/env python
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import re
+import sys
+
+from array import array
+from collections import defaultdict, namedtuple
+
+from operands import *
+from table import EXTENDED, family
+
+# Queries are either instructions written as in the listings, separated by
+# ';' to match consecutive ones (e.g. 'LDA #*; STA WSYNC'), or hex bytes
+# (e.g. 'A9 ?? 85 02'). In instructions '*' matches any mnemonic, operand
+# or value and '?' any hex digit, e.g. 'STA $8?,X' or 'LDA (*),Y'; a lone
+# '*' is any instruction. A mnemonic matches its undocumented aliases too:
+# 'NOP' finds NOP_1A, 'NOP_1A' only that one.
+
+InstrPattern = namedtuple('InstrPattern', 'mnemonic modes value')
+
+MNEMONIC = re.compile(r'^[A-Z]{3}(_[0-9A-F]{2})?$')
+HEX = re.compile(r'^\$([0-9A-F?]+)$', re.I)
+SYMBOL = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+BYTE = re.compile(r'^([0-9A-F]{2}|\?\?)$', re.I)
+
+# opcode trigrams are only looked up for patterns matching at most this many
+MAX_GRAMS = 64
+
+class SearchSyntaxError(Exception):
+    def __str__(self):
+        return 'invalid search ' + self.message
+
+def operand_value(addr, instr):
+    """The operand of an instruction as shown in the listings: branches
+    show their destination."""
+    mode = operand_mode(instr.opcode)
+
+    if mode is None:
+        return None
+    elif mode == M_REL:
+        return (addr + 2 + instr.src.offset) & 0xffff
+
+    operand = instr.src if instr.opcode.src == mode else instr.dst
+    return getattr(operand, mode.field)
+
+def parse_value(text):
+    """None for any value, ('$', hex digits) or ('symbol', name)."""
+    if text == '*':
+        return None
+
+    match = HEX.match(text)
+    if match:
+        return '$', match.group(1).upper()
+
+    if SYMBOL.match(text):
+        return 'symbol', text
+
+    raise SearchSyntaxError('value ' + text)
+
+def parse_instr(text):
+    parts = text.split(None, 1)
+    if not parts:
+        raise SearchSyntaxError('empty instruction')
+
+    mnemonic = parts[0].upper()
+    if mnemonic == '*':
+        mnemonic = None
+    elif not MNEMONIC.match(mnemonic):
+        raise SearchSyntaxError('mnemonic ' + parts[0])
+
+    operand = parts[1].strip() if len(parts) > 1 else ''
+    if operand == '*' or (mnemonic is None and not operand):
+        return InstrPattern(mnemonic, None, None)
+    if operand in ('', 'A', 'a'):
+        return InstrPattern(mnemonic, frozenset([None]), None)
+
+    for regexp, modes in OPERAND_SYNTAX:
+        match = regexp.match(operand)
+        if match:
+            return InstrPattern(mnemonic, frozenset(modes), parse_value(match.group(1).strip()))
+
+def parse(query):
+    """A byte pattern, [byte or None], if query is made of hex bytes and ??,
+    otherwise a list of InstrPattern."""
+    tokens = query.split()
+    if tokens and all(BYTE.match(token) for token in tokens):
+        return [None if token == '??' else int(token, 16) for token in tokens]
+
+    return [parse_instr(part) for part in query.split(';')]
+
+def is_byte_pattern(pattern):
+    return not isinstance(pattern[0], InstrPattern)
+
+def opcodes_matching(pattern, opcodes=EXTENDED):
+    return set(code for code, opcode in opcodes.items()
+               if (pattern.mnemonic in (None, opcode.mnemonic, family(opcode.mnemonic))) and
+                  (pattern.modes is None or operand_mode(opcode) in pattern.modes))
+
+def value_matcher(value, symbols=None):
+    """Predicate on the operand values, None if any value matches. Symbols
+    maps names to sets of addresses, None leaves them to the caller."""
+    if value is None:
+        return None
+
+    kind, text = value
+    if kind == 'symbol':
+        if symbols is None:
+            return None
+
+        addrs = symbols.get(text, ())
+        return lambda v: v in addrs
+
+    if '?' not in text:
+        return int(text, 16).__eq__
+
+    regexp = re.compile(text.replace('?', '.') + '$')
+    width = len(text)
+    return lambda v: v is not None and v < 16 ** width and regexp.match('%0*X' % (width, v)) is not None
+
+def value_range(text):
+    """Smallest and largest value matching hex digits with wildcards."""
+    return int(text.replace('?', '0'), 16), int(text.replace('?', 'F'), 16)
+
+def byte_regexp(pattern):
+    return re.compile(''.join('.' if byte is None else re.escape(chr(byte)) for byte in pattern), re.DOTALL)
+
+def gram(b0, b1, b2):
+    return b0 << 16 | b1 << 8 | b2
+
+def in_region(mask, offset, length, where):
+    if where is None:
+        return True
+
+    region = mask[offset:offset+length]
+    if where == 'code':
+        return '\0' not in region
+    return '\1' not in region
+
+class SearchIndex(object):
+    """The instructions and bytes of a traced Memory, indexed for search().
+
+    Instructions are the traced code plus a linear decoding of the rest;
+    they are indexed by (mnemonic, operand mode) and by the trigrams of
+    their opcodes. The raw bytes are indexed by trigram. Queries don't
+    decode anything."""
+
+    def __init__(self, memory, instrs=None):
+        if instrs is None:
+            instrs = memory.traced_instrs()
+
+        self.memory = memory
+        self.start = memory.start
+        self.image = str(memory.memory)
+
+        # one byte per address, 1 for traced code
+        mask = bytearray(len(self.image))
+        for addr, instr in instrs:
+            offset = addr - self.start
+            mask[offset:offset+instr.opcode.size] = '\1' * instr.opcode.size
+        self.mask = str(mask)
+
+        # parallel arrays, sorted by address
+        self.addrs = array('i')
+        self.opcodes = bytearray()
+        self.values = []
+        self.code = bytearray()
+
+        decoded = sorted(instrs + self.decode_data())
+        for addr, instr in decoded:
+            self.addrs.append(addr)
+            self.opcodes.append(memory[addr])
+            self.values.append(operand_value(addr, instr))
+            self.code.append(self.mask[addr - self.start] == '\1')
+
+        # position of the next instruction, -1 if it isn't decoded
+        position = dict((addr, pos) for pos, addr in enumerate(self.addrs))
+        self.next = array('i', (position.get(addr + instr.opcode.size, -1) for addr, instr in decoded))
+
+        self.postings = defaultdict(lambda: array('i'))
+        for pos, (addr, instr) in enumerate(decoded):
+            self.postings[instr.opcode.mnemonic, operand_mode(instr.opcode)].append(pos)
+
+        self.opcode_grams = defaultdict(lambda: array('i'))
+        for pos in xrange(len(decoded)):
+            pos1 = self.next[pos]
+            pos2 = self.next[pos1] if pos1 >= 0 else -1
+            if pos2 >= 0:
+                self.opcode_grams[gram(self.opcodes[pos], self.opcodes[pos1], self.opcodes[pos2])].append(pos)
+
+        # padded, so that patterns ending with the image have a trigram
+        image = bytearray(self.image) + bytearray(2)
+        self.byte_grams = defaultdict(lambda: array('i'))
+        for offset in xrange(len(self.image)):
+            self.byte_grams[gram(image[offset], image[offset+1], image[offset+2])].append(offset)
+
+        self.symbols = defaultdict(set)
+        for addr, symbol in memory.labels():
+            self.symbols[symbol].add(addr)
+
+    def decode_data(self):
+        """Linear decoding of the bytes that aren't traced code."""
+        memory = self.memory
+        instrs = []
+
+        offset = 0
+        while offset < len(self.image):
+            size = 1
+
+            if self.mask[offset] == '\0' and ord(self.image[offset]) in memory.opcodes:
+                size = memory.opcodes[ord(self.image[offset])].size
+                if '\1' not in self.mask[offset:offset+size] and offset + size <= len(self.image):
+                    instrs.append((self.start + offset, memory.dis_instruction(self.start + offset)))
+                else:
+                    size = 1
+
+            offset += size
+
+        return instrs
+
+    def search(self, query, where=None):
+        """Sorted (addr, length) of the matches of query, in the traced code
+        or in the data only if where is 'code' or 'data'."""
+        pattern = parse(query) if isinstance(query, basestring) else query
+
+        if is_byte_pattern(pattern):
+            return self.search_bytes(pattern, where)
+
+        return self.search_instrs(pattern, where)
+
+    def candidates(self, patterns, opcode_sets):
+        """Positions where the first pattern may match, from the smallest of
+        the (mnemonic, mode) postings and the opcode trigrams."""
+        keys = set((EXTENDED[code].mnemonic, operand_mode(EXTENDED[code])) for code in opcode_sets[0])
+        found = [pos for key in keys if key in self.postings for pos in self.postings[key]]
+
+        if len(patterns) >= 3 and len(opcode_sets[0]) * len(opcode_sets[1]) * len(opcode_sets[2]) <= MAX_GRAMS:
+            grams = [pos for op0 in opcode_sets[0] for op1 in opcode_sets[1] for op2 in opcode_sets[2]
+                     for pos in self.opcode_grams.get(gram(op0, op1, op2), ())]
+            if len(grams) < len(found):
+                found = grams
+
+        return sorted(found)
+
+    def search_instrs(self, patterns, where=None):
+        opcode_sets = [opcodes_matching(pattern) for pattern in patterns]
+        matchers = [value_matcher(pattern.value, self.symbols) for pattern in patterns]
+        code = None if where is None else where == 'code'
+
+        result = []
+        for first in self.candidates(patterns, opcode_sets):
+            pos = first
+            for opcodes, matcher in zip(opcode_sets, matchers):
+                if pos < 0 or self.opcodes[pos] not in opcodes:
+                    break
+                if matcher is not None and not matcher(self.values[pos]):
+                    break
+                if code is not None and self.code[pos] != code:
+                    break
+
+                last, pos = pos, self.next[pos]
+            else:
+                end = self.addrs[last] + EXTENDED[self.opcodes[last]].size
+                result.append((self.addrs[first], end - self.addrs[first]))
+
+        return result
+
+    def search_bytes(self, pattern, where=None):
+        best = None
+        for i in xrange(len(pattern) - 2):
+            if None in pattern[i:i+3]:
+                continue
+
+            offsets = self.byte_grams.get(gram(*pattern[i:i+3]), ())
+            if best is None or len(offsets) < len(best[1]):
+                best = i, offsets
+
+        regexp = byte_regexp(pattern)
+
+        if best is None:
+            # nothing to look up, the image is small enough to be scanned
+            candidates = []
+            match = regexp.search(self.image)
+            while match:
+                candidates.append(match.start())
+                match = regexp.search(self.image, match.start() + 1)
+        else:
+            i, offsets = best
+            candidates = (offset - i for offset in offsets if offset >= i)
+
+        return [(self.start + offset, len(pattern)) for offset in candidates
+                if regexp.match(self.image, offset) and in_region(self.mask, offset, len(pattern), where)]
+
+def instr_text(memory, addr):
+    """An instruction as written in the listings, without the label."""
+    from memory import formatter
+
+    instr = memory.dis_instruction(addr)
+    template, render = formatter(instr.opcode)
+    line = template % '' if render is None else template % ('', render(instr, addr, memory))
+
+    return ' '.join(line.split())
+
+def describe(memory, addr, length, pattern):
+    """The text of a match: its instructions or its bytes."""
+    if is_byte_pattern(pattern):
+        return ' '.join('%02X' % memory[a] for a in xrange(addr, addr + length))
+
+    texts = []
+    end = addr + length
+    while addr < end:
+        texts.append(instr_text(memory, addr))
+        addr += memory.dis_instruction(addr).opcode.size
+
+    return ' ; '.join(texts)
+
+def search_store(db, query, where=None):
+    """Yield (ROM name, addr, matching bytes) for the matches of query in all
+    the ROMs of a database written by store.Store."""
+    pattern = parse(query)
+
+    images = {}
+    def image(rom_id):
+        if rom_id not in images:
+            images[rom_id] = tuple(str(value) if isinstance(value, buffer) else value for value in
+                                   db.execute('SELECT roms.name, roms.org, data, code FROM images '
+                                              'JOIN roms ON roms.id = images.rom_id WHERE rom_id = ?',
+                                              (rom_id,)).fetchone())
+        return images[rom_id]
+
+    if is_byte_pattern(pattern):
+        matches = search_store_bytes(db, pattern, where, image)
+    else:
+        matches = search_store_instrs(db, pattern, where)
+
+    for rom_id, addr, length in matches:
+        name, org, data, code = image(rom_id)
+        yield name, addr, data[addr-org:addr-org+length]
+
+def search_store_instrs(db, patterns, where):
+    joins, conditions, params = [], [], []
+
+    for k, pattern in enumerate(patterns):
+        alias = 'i%d' % k
+        if k:
+            joins.append('JOIN instructions %s ON %s.rom_id = i0.rom_id AND %s.addr = i%d.next' % (alias, alias, alias, k - 1))
+
+        opcodes = opcodes_matching(pattern)
+        if not opcodes:
+            return
+
+        conditions.append('%s.opcode IN (%s)' % (alias, ', '.join(str(code) for code in sorted(opcodes))))
+
+        if pattern.value is not None:
+            kind, text = pattern.value
+            if kind == 'symbol':
+                conditions.append('%s.value IN (SELECT addr FROM symbols WHERE name = ? AND '
+                                  '(symbols.rom_id IS NULL OR symbols.rom_id = i0.rom_id))' % alias)
+                params.append(text)
+            else:
+                conditions.append('%s.value BETWEEN ? AND ?' % alias)
+                params.extend(value_range(text))
+
+        if where is not None:
+            conditions.append('%s.code = %d' % (alias, where == 'code'))
+
+    last = 'i%d' % (len(patterns) - 1)
+    sql = ('SELECT i0.rom_id, i0.addr, %s.next - i0.addr, %s FROM instructions i0 %s WHERE %s ORDER BY i0.rom_id, i0.addr' %
+           (last, ', '.join('i%d.value' % k for k in xrange(len(patterns))), ' '.join(joins), ' AND '.join(conditions)))
+
+    # wildcards in the middle of values, the SQL only checks their range
+    matchers = [value_matcher(pattern.value) for pattern in patterns]
+
+    for row in db.execute(sql, params):
+        if all(matcher is None or matcher(value) for matcher, value in zip(matchers, row[3:])):
+            yield row[:3]
+
+def gram_range(pattern, i):
+    """(lo, hi) of the trigrams starting with the fixed bytes at pattern[i],
+    None if pattern[i] is a wildcard."""
+    prefix = []
+    for byte in pattern[i:i+3]:
+        if byte is None:
+            break
+        prefix.append(byte)
+
+    if not prefix:
+        return None
+
+    free = 8 * (3 - len(prefix))
+    lo = gram(*(prefix + [0] * (3 - len(prefix))))
+    return lo, lo | ((1 << free) - 1)
+
+def search_store_bytes(db, pattern, where, image):
+    best = None
+    for i in xrange(len(pattern)):
+        window = gram_range(pattern, i)
+        if window is None:
+            continue
+
+        count = db.execute('SELECT COUNT(*) FROM grams WHERE gram BETWEEN ? AND ?', window).fetchone()[0]
+        if best is None or count < best[1]:
+            best = i, count, window
+
+    regexp = byte_regexp(pattern)
+
+    if best is None:
+        # only wildcards, scan all the images
+        for rom_id, in db.execute('SELECT rom_id FROM images ORDER BY rom_id').fetchall():
+            name, org, data, code = image(rom_id)
+            for offset in xrange(len(data) - len(pattern) + 1):
+                if in_region(code, offset, len(pattern), where):
+                    yield rom_id, org + offset, len(pattern)
+        return
+
+    i, count, window = best
+    for rom_id, addr in db.execute('SELECT rom_id, addr FROM grams WHERE gram BETWEEN ? AND ? ORDER BY rom_id, addr',
+                                   window).fetchall():
+        name, org, data, code = image(rom_id)
+        offset = addr - org - i
+        if offset >= 0 and regexp.match(data, offset) and in_region(code, offset, len(pattern), where):
+            yield rom_id, org + offset, len(pattern)
+
+def main():
+    import argparse
+
+    from store import Store
+
+    parser = argparse.ArgumentParser(description="Search the ROMs of a database written by dis6502.py --store")
+
+    parser.add_argument('database')
+    parser.add_argument('query', help="e.g. 'STA WSYNC', 'LDA (*),Y; STA $8?' or 'A9 ?? 85 02'")
+    parser.add_argument('--where', default=None, choices=('code', 'data'))
+
+    args = parser.parse_args()
+
+    store = Store(args.database)
+    for name, addr, data in search_store(store.db, args.query, args.where):
+        print '%s\t%04X\t%s' % (name, addr, ' '.join('%02X' % ord(byte) for byte in data))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print e
+        sys.exit(1)
+    else:
+        sys.exit(0)
@@ -0,0 +1,293 @@
+#! /usr/bin/env python
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import hashlib
+import sqlite3
+import sys
+
+from callgraph import CallGraph
+from operands import *
+from search import SearchIndex
+from table import EXTENDED
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS roms (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    sha1 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    org INTEGER NOT NULL,
+    code_bytes INTEGER NOT NULL,
+    data_bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS routines (
+    rom_id INTEGER NOT NULL,
+    addr INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    depth INTEGER,
+    stack INTEGER,
+    recursive INTEGER NOT NULL,
+    -- recursive or calling a recursive routine: depth and stack are NULL
+    unbounded INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS calls (
+    rom_id INTEGER NOT NULL,
+    routine INTEGER NOT NULL,
+    dest INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    sites INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    rom_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS xrefs (
+    rom_id INTEGER NOT NULL,
+    addr INTEGER NOT NULL,
+    routine INTEGER,
+    dest INTEGER NOT NULL,
+    kind TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    rom_id INTEGER NOT NULL,
+    addr INTEGER NOT NULL,
+    kinds TEXT NOT NULL
+);
+-- the traced instructions plus a linear decoding of the rest, for search.py;
+-- next is the address of the following instruction
+CREATE TABLE IF NOT EXISTS instructions (
+    rom_id INTEGER NOT NULL,
+    addr INTEGER NOT NULL,
+    opcode INTEGER NOT NULL,
+    value INTEGER,
+    next INTEGER NOT NULL,
+    code INTEGER NOT NULL
+);
+-- code has a byte per address, 1 for the traced code
+CREATE TABLE IF NOT EXISTS images (
+    rom_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL,
+    code BLOB NOT NULL
+);
+-- trigrams of the ROM bytes, b0 << 16 | b1 << 8 | b2, at addr
+CREATE TABLE IF NOT EXISTS grams (
+    gram INTEGER NOT NULL,
+    rom_id INTEGER NOT NULL,
+    addr INTEGER NOT NULL
+);
+-- paths the tracer gave up: from start, failing at addr
+CREATE TABLE IF NOT EXISTS faults (
+    rom_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    addr INTEGER NOT NULL,
+    error TEXT NOT NULL
+);
+-- rom_id is NULL for the symbols shared by all the ROMs, e.g. the TIA registers
+CREATE TABLE IF NOT EXISTS symbols (
+    rom_id INTEGER,
+    addr INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+'''
+
+# created once the data is loaded, it's faster than keeping them up to date
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS routines_rom ON routines (rom_id, addr);
+CREATE INDEX IF NOT EXISTS routines_name ON routines (name);
+CREATE INDEX IF NOT EXISTS calls_rom ON calls (rom_id, routine);
+CREATE INDEX IF NOT EXISTS calls_dest ON calls (rom_id, dest);
+CREATE INDEX IF NOT EXISTS blocks_rom ON blocks (rom_id, start);
+CREATE INDEX IF NOT EXISTS xrefs_rom ON xrefs (rom_id, addr);
+CREATE INDEX IF NOT EXISTS xrefs_dest ON xrefs (dest, kind);
+CREATE INDEX IF NOT EXISTS annotations_rom ON annotations (rom_id, addr);
+CREATE INDEX IF NOT EXISTS instructions_opcode ON instructions (opcode, value);
+CREATE INDEX IF NOT EXISTS instructions_rom ON instructions (rom_id, addr);
+CREATE INDEX IF NOT EXISTS grams_gram ON grams (gram);
+CREATE INDEX IF NOT EXISTS faults_rom ON faults (rom_id, start);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS symbols_rom ON symbols (rom_id, addr);
+'''
+
+TABLES = ('routines', 'calls', 'blocks', 'xrefs', 'annotations', 'instructions', 'images', 'grams', 'faults', 'symbols')
+
+ACCESS_KINDS = {'r': 'read', 'w': 'write', 'm': 'rmw'}
+
+QUERIES = {
+    # ROMs writing to a register or variable from a routine called (directly) by another one
+    'writes': '''
+        SELECT DISTINCT roms.name, routines.name FROM xrefs
+        JOIN roms ON roms.id = xrefs.rom_id
+        JOIN symbols ON symbols.addr = xrefs.dest AND (symbols.rom_id IS NULL OR symbols.rom_id = xrefs.rom_id)
+        JOIN calls ON calls.rom_id = xrefs.rom_id AND calls.dest = xrefs.routine
+        JOIN routines ON routines.rom_id = calls.rom_id AND routines.addr = calls.routine
+        WHERE xrefs.kind IN ('write', 'rmw') AND symbols.name = ? AND routines.name LIKE ?
+        ORDER BY roms.name
+    ''',
+    'ratio': '''
+        SELECT size, COUNT(*), AVG(CAST(code_bytes AS REAL) / MAX(data_bytes, 1)) FROM roms
+        GROUP BY size ORDER BY size
+    ''',
+    'faults': '''
+        SELECT roms.name, faults.start, faults.addr, faults.error FROM faults
+        JOIN roms ON roms.id = faults.rom_id
+        ORDER BY roms.name, faults.start
+    ''',
+    'stack': '''
+        SELECT roms.name, routines.stack FROM routines
+        JOIN roms ON roms.id = routines.rom_id
+        WHERE routines.name = 'START' ORDER BY routines.stack DESC
+    ''',
+}
+
+class Store(object):
+    """Analysis results of many ROMs in a SQLite database.
+
+    ROMs are added inside a transaction committed every batch ROMs; the
+    indexes are created by close()."""
+
+    def __init__(self, path, batch=500):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('PRAGMA journal_mode = MEMORY')
+
+        self.batch = batch
+        self.pending = 0
+        self.shared_symbols = None
+
+    def add(self, name, memory, starts):
+        db = self.db
+
+        row = db.execute('SELECT id FROM roms WHERE name = ?', (name,)).fetchone()
+        if row is not None:
+            for table in TABLES:
+                db.execute('DELETE FROM %s WHERE rom_id = ?' % table, row)
+            db.execute('DELETE FROM roms WHERE id = ?', row)
+
+        if self.shared_symbols is not memory.symbols.defaults:
+            self.shared_symbols = memory.symbols.defaults
+            db.execute('DELETE FROM symbols WHERE rom_id IS NULL')
+            db.executemany('INSERT INTO symbols VALUES (NULL, ?, ?)', self.shared_symbols.items())
+
+        instrs = memory.traced_instrs()
+        code_bytes = sum(instr.opcode.size for addr, instr in instrs)
+
+        cursor = db.execute('INSERT INTO roms VALUES (NULL, ?, ?, ?, ?, ?, ?)',
+                            (name, hashlib.sha1(memory.memory).hexdigest(), len(memory.memory),
+                             memory.start, code_bytes, len(memory.memory) - code_bytes))
+        rom_id = cursor.lastrowid
+
+        graph = CallGraph(memory, starts)
+        db.executemany('INSERT INTO routines VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       ((rom_id, routine.addr, routine.name, routine.depth, routine.stack, routine.recursive,
+                         routine.unbounded)
+                        for routine in graph.routines.values()))
+        db.executemany('INSERT INTO calls VALUES (?, ?, ?, ?, ?)',
+                       ((rom_id, routine.addr, dest_addr, kind, routine.edges[kind, dest_addr][0])
+                        for routine in graph.routines.values()
+                        for kind, dest_addr in routine.edge_order))
+
+        db.executemany('INSERT INTO blocks VALUES (?, ?, ?)',
+                       ((rom_id, start, stop) for start, stop in memory.basic_blocks(instrs)))
+
+        db.executemany('INSERT INTO xrefs VALUES (?, ?, ?, ?, ?)', self.xrefs(rom_id, memory, instrs))
+
+        db.executemany('INSERT INTO annotations VALUES (?, ?, ?)',
+                       ((rom_id, addr, ''.join(sorted(kinds)))
+                        for addr, kinds in memory.annotations.items() if kinds))
+
+        self.add_search_index(rom_id, SearchIndex(memory, instrs))
+
+        db.executemany('INSERT INTO faults VALUES (?, ?, ?, ?)',
+                       ((rom_id, start, fault.addr, str(fault.error))
+                        for start, fault in sorted(memory.faults.items())))
+
+        db.executemany('INSERT INTO symbols VALUES (?, ?, ?)',
+                       ((rom_id, addr, symbol) for addr, symbol in memory.labels()
+                        if memory.symbols.defaults.get(addr) != symbol))
+
+        self.pending += 1
+        if self.pending >= self.batch:
+            self.commit()
+
+    def xrefs(self, rom_id, memory, instrs):
+        routine_of = memory.routine_finder()
+
+        for addr, instr in instrs:
+            routine = routine_of(addr)
+
+            if instr.opcode.src == M_REL:
+                yield rom_id, addr, routine, addr + instr.opcode.size + instr.src.offset, 'branch'
+            elif addr in memory.calls:
+                yield rom_id, addr, routine, memory.calls[addr], 'call'
+            elif addr in memory.jumps:
+                yield rom_id, addr, routine, memory.jumps[addr], 'jump'
+
+            for dest, kind in memory.access.counted.get(addr, ()):
+                yield rom_id, addr, routine, dest, ACCESS_KINDS[kind]
+
+    def add_search_index(self, rom_id, index):
+        db = self.db
+
+        db.executemany('INSERT INTO instructions VALUES (?, ?, ?, ?, ?, ?)',
+                       ((rom_id, addr, opcode, value, addr + EXTENDED[opcode].size, code)
+                        for addr, opcode, value, code in zip(index.addrs, index.opcodes, index.values, index.code)))
+
+        db.execute('INSERT INTO images VALUES (?, ?, ?)', (rom_id, sqlite3.Binary(index.image), sqlite3.Binary(index.mask)))
+
+        db.executemany('INSERT INTO grams VALUES (?, ?, ?)',
+                       ((key, rom_id, index.start + offset)
+                        for key, offsets in index.byte_grams.items() for offset in offsets))
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.executescript(INDEXES)
+        self.db.commit()
+        self.db.close()
+
+    def query(self, sql, params=()):
+        return self.db.execute(QUERIES.get(sql, sql), params)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query a database written by dis6502.py --store")
+
+    parser.add_argument('database')
+    parser.add_argument('query', help='SQL, or one of: %s' % ', '.join(sorted(QUERIES)))
+    parser.add_argument('params', nargs='*')
+
+    args = parser.parse_args()
+
+    store = Store(args.database)
+    for row in store.query(args.query, args.params):
+        print '\t'.join('' if value is None else str(value) for value in row)
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print e
+        sys.exit(1)
+    else:
+        sys.exit(0)
@@ -0,0 +1,258 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import os
+import re
+
+from bisect import bisect_left, bisect_right
+
+class UnknownSymbolFormatError(Exception):
+    def __str__(self):
+        return 'unknown symbol file format ' + self.message
+
+class SymbolTable(object):
+    """Address indexed symbols of a single Memory.
+
+    Lookups go through the current bank first, then the symbols added to
+    this table and finally the (shared, never modified) defaults."""
+
+    def __init__(self, defaults=None):
+        if defaults is None:
+            defaults = {}
+
+        self.defaults = defaults
+        self.local = {}
+        self.banks = {}
+        self.bank = None
+
+        self._sorted = None
+
+    def __getitem__(self, addr):
+        if self.bank is not None:
+            bank = self.banks.get(self.bank)
+            if bank and addr in bank:
+                return bank[addr]
+
+        if addr in self.local:
+            return self.local[addr]
+
+        return self.defaults[addr]
+
+    def __setitem__(self, addr, symbol):
+        self.add(addr, symbol)
+
+    def __contains__(self, addr):
+        try:
+            self[addr]
+        except KeyError:
+            return False
+        else:
+            return True
+
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.addresses())
+
+    def __iter__(self):
+        return iter(self.addresses())
+
+    def copy(self):
+        """A table with its own symbols and banks, sharing the defaults."""
+        table = SymbolTable(self.defaults)
+        table.local = dict(self.local)
+        table.banks = dict((bank, dict(symbols)) for bank, symbols in self.banks.items())
+        table.bank = self.bank
+
+        return table
+
+    def get(self, addr, default=None):
+        try:
+            return self[addr]
+        except KeyError:
+            return default
+
+    def add(self, addr, symbol, bank=None):
+        if bank is None:
+            self.local[addr] = symbol
+        else:
+            self.banks.setdefault(bank, {})[addr] = symbol
+
+        self._sorted = None
+
+    def update(self, pairs, bank=None, start=None, end=None):
+        """Bulk add (addr, symbol) pairs, keeping only the addresses
+        between start and end (inclusive) if given."""
+        if bank is None:
+            table = self.local
+        else:
+            table = self.banks.setdefault(bank, {})
+
+        if hasattr(pairs, 'items'):
+            pairs = pairs.items()
+
+        if start is None and end is None:
+            table.update(pairs)
+        else:
+            lo = 0 if start is None else start
+            hi = 0xffffffff if end is None else end
+            table.update((addr, symbol) for addr, symbol in pairs if lo <= addr <= hi)
+
+        self._sorted = None
+
+    def addresses(self):
+        if self._sorted is None:
+            addrs = set(self.defaults)
+            addrs.update(self.local)
+            if self.bank is not None:
+                addrs.update(self.banks.get(self.bank, ()))
+
+            self._sorted = sorted(addrs)
+
+        return self._sorted
+
+    def select_bank(self, bank):
+        self.bank = bank
+        self._sorted = None
+
+    def items(self):
+        return [(addr, self[addr]) for addr in self.addresses()]
+
+    def range(self, start, end):
+        """The (addr, symbol) pairs with start <= addr <= end, sorted by address."""
+        addrs = self.addresses()
+        lo = bisect_left(addrs, start)
+        hi = bisect_right(addrs, end)
+
+        return [(addr, self[addr]) for addr in addrs[lo:hi]]
+
+    def load(self, path, fmt=None, bank=None, start=None, end=None):
+        with open(path) as file_:
+            self.update(read(file_, fmt or guess_format(path)), bank=bank, start=start, end=end)
+
+# DASM: dasm -s
+#
+# --- Symbol List (sorted by symbol)
+# START                    f000              (R )
+# --- End of Symbol List.
+
+def read_dasm(file_):
+    for line in file_:
+        if line.startswith('---'):
+            continue
+
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+
+        try:
+            yield int(fields[1], 16), fields[0]
+        except ValueError:
+            # string symbols and unresolved values
+            continue
+
+def write_dasm(file_, pairs):
+    file_.write('--- Symbol List (sorted by symbol)\n')
+    for addr, symbol in sorted(pairs, key=lambda pair: pair[1]):
+        file_.write('%-24s %04x\n' % (symbol, addr))
+    file_.write('--- End of Symbol List.\n')
+
+# VICE monitor labels, also produced by ld65 -Ln
+#
+# al C:f000 .START
+# add_label $f000 .START
+
+VICE_LINE = re.compile(r'^\s*(?:al|add_label)\s+(?:[A-Za-z]:)?\$?([0-9A-Fa-f]+)\s+\.?(\S+)')
+
+def read_vice(file_):
+    match = VICE_LINE.match
+    for line in file_:
+        m = match(line)
+        if m:
+            yield int(m.group(1), 16), m.group(2)
+
+def write_vice(file_, pairs):
+    file_.writelines('al C:%04x .%s\n' % (addr, symbol) for addr, symbol in sorted(pairs))
+
+# ca65/ld65 debug info: ld65 --dbgfile
+#
+# sym	id=0,name="START",addrsize=absolute,size=1,scope=0,def=1,val=0xF000,seg=0,type=lab
+
+DBG_FIELD = re.compile(r'(\w+)=("[^"]*"|[^,]*)')
+
+def read_ca65_dbg(file_):
+    for line in file_:
+        if not line.startswith('sym\t'):
+            continue
+
+        fields = dict(DBG_FIELD.findall(line[4:]))
+        if 'val' not in fields or 'name' not in fields:
+            # imports and other symbols without a value
+            continue
+
+        yield int(fields['val'], 0), fields['name'].strip('"')
+
+def write_ca65_dbg(file_, pairs):
+    pairs = sorted(pairs)
+
+    file_.write('version\tmajor=2,minor=0\n')
+    file_.write('info\tsym=%d\n' % len(pairs))
+    for id_, (addr, symbol) in enumerate(pairs):
+        addrsize = 'zeropage' if addr < 0x100 else 'absolute'
+        file_.write('sym\tid=%d,name="%s",addrsize=%s,scope=0,def=0,val=0x%X,type=lab\n' % (id_, symbol, addrsize, addr))
+
+FORMATS = {
+    'dasm': (read_dasm, write_dasm),
+    'vice': (read_vice, write_vice),
+    'ca65': (read_ca65_dbg, write_ca65_dbg),
+}
+
+EXTENSIONS = {
+    '.sym': 'dasm',
+    '.lbl': 'vice',
+    '.lab': 'vice',
+    '.vice': 'vice',
+    '.dbg': 'ca65',
+}
+
+def guess_format(path):
+    ext = os.path.splitext(path)[1].lower()
+
+    try:
+        return EXTENSIONS[ext]
+    except KeyError:
+        raise UnknownSymbolFormatError(path)
+
+def read(file_, fmt):
+    try:
+        reader, _ = FORMATS[fmt]
+    except KeyError:
+        raise UnknownSymbolFormatError(fmt)
+
+    return reader(file_)
+
+def write(file_, pairs, fmt):
+    try:
+        _, writer = FORMATS[fmt]
+    except KeyError:
+        raise UnknownSymbolFormatError(fmt)
+
+    writer(file_, pairs)
+
+def save(path, pairs, fmt=None):
+    with open(path, 'w') as file_:
+        write(file_, pairs, fmt or guess_format(path))
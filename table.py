@@ -153,3 +153,104 @@ TABLE = {
     0xfd: Op(mnemonic="SBC", src=M_ABSX, dst=M_AC, cycles=4),
     0xfe: Op(mnemonic="INC", src=M_ABSX, dst=M_ABSX, cycles=7),
 }
+
+# the stable undocumented opcodes, used on purpose by many 2600 games; the
+# unstable ones (ANE, LXA, SHA...) and the ones halting the CPU are left out.
+# The aliases of another opcode with the same operand get its mnemonic
+# followed by their own byte (NOP_1A, SBC_EB, SKB_89...), so the listing
+# tells which one is in the ROM, see family()
+UNDOCUMENTED = {
+    0x03: Op(mnemonic="SLO", src=M_INDX, dst=M_INDX, cycles=8),
+    0x04: Op(mnemonic="SKB", src=M_ZERO, dst=M_NONE, cycles=3),
+    0x07: Op(mnemonic="SLO", src=M_ZERO, dst=M_ZERO, cycles=5),
+    0x0b: Op(mnemonic="ANC", src=M_IMM, dst=M_AC, cycles=2),
+    0x0c: Op(mnemonic="SKW", src=M_ABS, dst=M_NONE, cycles=4),
+    0x0f: Op(mnemonic="SLO", src=M_ABS, dst=M_ABS, cycles=6),
+    0x13: Op(mnemonic="SLO", src=M_INDY, dst=M_INDY, cycles=8),
+    0x14: Op(mnemonic="SKB", src=M_ZERX, dst=M_NONE, cycles=4),
+    0x17: Op(mnemonic="SLO", src=M_ZERX, dst=M_ZERX, cycles=6),
+    0x1a: Op(mnemonic="NOP_1A", src=M_NONE, dst=M_NONE, cycles=2),
+    0x1b: Op(mnemonic="SLO", src=M_ABSY, dst=M_ABSY, cycles=7),
+    0x1c: Op(mnemonic="SKW", src=M_ABSX, dst=M_NONE, cycles=4),
+    0x1f: Op(mnemonic="SLO", src=M_ABSX, dst=M_ABSX, cycles=7),
+    0x23: Op(mnemonic="RLA", src=M_INDX, dst=M_INDX, cycles=8),
+    0x27: Op(mnemonic="RLA", src=M_ZERO, dst=M_ZERO, cycles=5),
+    0x2b: Op(mnemonic="ANC_2B", src=M_IMM, dst=M_AC, cycles=2),
+    0x2f: Op(mnemonic="RLA", src=M_ABS, dst=M_ABS, cycles=6),
+    0x33: Op(mnemonic="RLA", src=M_INDY, dst=M_INDY, cycles=8),
+    0x34: Op(mnemonic="SKB_34", src=M_ZERX, dst=M_NONE, cycles=4),
+    0x37: Op(mnemonic="RLA", src=M_ZERX, dst=M_ZERX, cycles=6),
+    0x3a: Op(mnemonic="NOP_3A", src=M_NONE, dst=M_NONE, cycles=2),
+    0x3b: Op(mnemonic="RLA", src=M_ABSY, dst=M_ABSY, cycles=7),
+    0x3c: Op(mnemonic="SKW_3C", src=M_ABSX, dst=M_NONE, cycles=4),
+    0x3f: Op(mnemonic="RLA", src=M_ABSX, dst=M_ABSX, cycles=7),
+    0x43: Op(mnemonic="SRE", src=M_INDX, dst=M_INDX, cycles=8),
+    0x44: Op(mnemonic="SKB_44", src=M_ZERO, dst=M_NONE, cycles=3),
+    0x47: Op(mnemonic="SRE", src=M_ZERO, dst=M_ZERO, cycles=5),
+    0x4b: Op(mnemonic="ALR", src=M_IMM, dst=M_AC, cycles=2),
+    0x4f: Op(mnemonic="SRE", src=M_ABS, dst=M_ABS, cycles=6),
+    0x53: Op(mnemonic="SRE", src=M_INDY, dst=M_INDY, cycles=8),
+    0x54: Op(mnemonic="SKB_54", src=M_ZERX, dst=M_NONE, cycles=4),
+    0x57: Op(mnemonic="SRE", src=M_ZERX, dst=M_ZERX, cycles=6),
+    0x5a: Op(mnemonic="NOP_5A", src=M_NONE, dst=M_NONE, cycles=2),
+    0x5b: Op(mnemonic="SRE", src=M_ABSY, dst=M_ABSY, cycles=7),
+    0x5c: Op(mnemonic="SKW_5C", src=M_ABSX, dst=M_NONE, cycles=4),
+    0x5f: Op(mnemonic="SRE", src=M_ABSX, dst=M_ABSX, cycles=7),
+    0x63: Op(mnemonic="RRA", src=M_INDX, dst=M_INDX, cycles=8),
+    0x64: Op(mnemonic="SKB_64", src=M_ZERO, dst=M_NONE, cycles=3),
+    0x67: Op(mnemonic="RRA", src=M_ZERO, dst=M_ZERO, cycles=5),
+    0x6b: Op(mnemonic="ARR", src=M_IMM, dst=M_AC, cycles=2),
+    0x6f: Op(mnemonic="RRA", src=M_ABS, dst=M_ABS, cycles=6),
+    0x73: Op(mnemonic="RRA", src=M_INDY, dst=M_INDY, cycles=8),
+    0x74: Op(mnemonic="SKB_74", src=M_ZERX, dst=M_NONE, cycles=4),
+    0x77: Op(mnemonic="RRA", src=M_ZERX, dst=M_ZERX, cycles=6),
+    0x7a: Op(mnemonic="NOP_7A", src=M_NONE, dst=M_NONE, cycles=2),
+    0x7b: Op(mnemonic="RRA", src=M_ABSY, dst=M_ABSY, cycles=7),
+    0x7c: Op(mnemonic="SKW_7C", src=M_ABSX, dst=M_NONE, cycles=4),
+    0x7f: Op(mnemonic="RRA", src=M_ABSX, dst=M_ABSX, cycles=7),
+    0x80: Op(mnemonic="SKB", src=M_IMM, dst=M_NONE, cycles=2),
+    0x82: Op(mnemonic="SKB_82", src=M_IMM, dst=M_NONE, cycles=2),
+    0x83: Op(mnemonic="SAX", src=M_AC, dst=M_INDX, cycles=6),
+    0x87: Op(mnemonic="SAX", src=M_AC, dst=M_ZERO, cycles=3),
+    0x89: Op(mnemonic="SKB_89", src=M_IMM, dst=M_NONE, cycles=2),
+    0x8f: Op(mnemonic="SAX", src=M_AC, dst=M_ABS, cycles=4),
+    0x97: Op(mnemonic="SAX", src=M_AC, dst=M_ZERY, cycles=4),
+    0xa3: Op(mnemonic="LAX", src=M_INDX, dst=M_AC, cycles=6),
+    0xa7: Op(mnemonic="LAX", src=M_ZERO, dst=M_AC, cycles=3),
+    0xaf: Op(mnemonic="LAX", src=M_ABS, dst=M_AC, cycles=4),
+    0xb3: Op(mnemonic="LAX", src=M_INDY, dst=M_AC, cycles=5),
+    0xb7: Op(mnemonic="LAX", src=M_ZERY, dst=M_AC, cycles=4),
+    0xbf: Op(mnemonic="LAX", src=M_ABSY, dst=M_AC, cycles=4),
+    0xc2: Op(mnemonic="SKB_C2", src=M_IMM, dst=M_NONE, cycles=2),
+    0xc3: Op(mnemonic="DCP", src=M_INDX, dst=M_INDX, cycles=8),
+    0xc7: Op(mnemonic="DCP", src=M_ZERO, dst=M_ZERO, cycles=5),
+    0xcb: Op(mnemonic="SBX", src=M_IMM, dst=M_XR, cycles=2),
+    0xcf: Op(mnemonic="DCP", src=M_ABS, dst=M_ABS, cycles=6),
+    0xd3: Op(mnemonic="DCP", src=M_INDY, dst=M_INDY, cycles=8),
+    0xd4: Op(mnemonic="SKB_D4", src=M_ZERX, dst=M_NONE, cycles=4),
+    0xd7: Op(mnemonic="DCP", src=M_ZERX, dst=M_ZERX, cycles=6),
+    0xda: Op(mnemonic="NOP_DA", src=M_NONE, dst=M_NONE, cycles=2),
+    0xdb: Op(mnemonic="DCP", src=M_ABSY, dst=M_ABSY, cycles=7),
+    0xdc: Op(mnemonic="SKW_DC", src=M_ABSX, dst=M_NONE, cycles=4),
+    0xdf: Op(mnemonic="DCP", src=M_ABSX, dst=M_ABSX, cycles=7),
+    0xe2: Op(mnemonic="SKB_E2", src=M_IMM, dst=M_NONE, cycles=2),
+    0xe3: Op(mnemonic="ISB", src=M_INDX, dst=M_INDX, cycles=8),
+    0xe7: Op(mnemonic="ISB", src=M_ZERO, dst=M_ZERO, cycles=5),
+    0xeb: Op(mnemonic="SBC_EB", src=M_IMM, dst=M_AC, cycles=2),
+    0xef: Op(mnemonic="ISB", src=M_ABS, dst=M_ABS, cycles=6),
+    0xf3: Op(mnemonic="ISB", src=M_INDY, dst=M_INDY, cycles=8),
+    0xf4: Op(mnemonic="SKB_F4", src=M_ZERX, dst=M_NONE, cycles=4),
+    0xf7: Op(mnemonic="ISB", src=M_ZERX, dst=M_ZERX, cycles=6),
+    0xfa: Op(mnemonic="NOP_FA", src=M_NONE, dst=M_NONE, cycles=2),
+    0xfb: Op(mnemonic="ISB", src=M_ABSY, dst=M_ABSY, cycles=7),
+    0xfc: Op(mnemonic="SKW_FC", src=M_ABSX, dst=M_NONE, cycles=4),
+    0xff: Op(mnemonic="ISB", src=M_ABSX, dst=M_ABSX, cycles=7),
+}
+
+def family(mnemonic):
+    """The mnemonic of an opcode without its alias suffix: NOP for NOP_1A."""
+    return mnemonic.split('_', 1)[0]
+
+# TABLE plus UNDOCUMENTED
+EXTENDED = dict(TABLE)
+EXTENDED.update(UNDOCUMENTED)
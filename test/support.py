@@ -0,0 +1,38 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+# Shared by the tests: small ROM images traced from their first byte.
+
+import memory
+
+ORG = 0xf000
+
+def image(chunks, size=0x100, fill='\xea'):
+    """An image made of (addr, code) chunks."""
+    data = bytearray(fill * size)
+    for addr, code in chunks:
+        data[addr-ORG:addr-ORG+len(code)] = code
+
+    return str(data)
+
+def traced(code, size=0x100, fill='\xea', start_label=None, **kwargs):
+    """Memory with code at ORG, padded to size, traced from ORG."""
+    mem = memory.Memory(code.ljust(size, fill), ORG, **kwargs)
+    if start_label is not None:
+        mem.add_symbol(ORG, start_label)
+    mem.trace_code([ORG])
+
+    return mem
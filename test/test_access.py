@@ -0,0 +1,46 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from support import ORG, traced
+
+class TestAccessCounters(unittest.TestCase):
+    def test_zero_page_modes(self):
+        # LDA $80, STA $81,X, INC $82, LDA ($84),Y, RTS
+        mem = traced('\xa5\x80\x95\x81\xe6\x82\xb1\x84\x60')
+        access = mem.access
+        self.assertEqual((1, 0, 0), (access.reads[0x80], access.writes[0x80], access.rmws[0x80]))
+        self.assertEqual((0, 1, 0), (access.reads[0x81], access.writes[0x81], access.rmws[0x81]))
+        self.assertEqual((0, 0, 1), (access.reads[0x82], access.writes[0x82], access.rmws[0x82]))
+        self.assertEqual((1, 1), (access.reads[0x84], access.reads[0x85]))
+        self.assertEqual(set(['r', 'w']), mem.annotations[0x82])
+
+    def test_sites_are_counted_once(self):
+        # LDA $80, BNE to the LDA itself, RTS: the LDA is traced twice
+        mem = traced('\xa5\x80\xd0\xfc\x60')
+        self.assertEqual(1, mem.access.reads[0x80])
+        self.assertEqual(set([ORG]), mem.access.sites[0x80])
+
+    def test_skips(self):
+        # SKB $80, SKB_44 $81, SKW $0282, RTS: the operands are ignored
+        mem = traced('\x04\x80\x44\x81\x0c\x82\x02\x60', undocumented=True)
+        self.assertEqual(0, mem.access.reads[0x80] + mem.access.reads[0x81] + mem.access.reads[0x282])
+        self.assertFalse('r' in mem.annotations[0x80])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+import archive
+import atari2600
+
+ROM = '\xea' * 2044 + '\x00\xf8\x00\xf8'
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+        self.rom = os.path.join(self.dir, 'game.bin')
+        with open(self.rom, 'wb') as file_:
+            file_.write(ROM)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def test_zip(self):
+        with zipfile.ZipFile(self.path('roms.zip'), 'w') as zip_:
+            zip_.write(self.rom, 'roms/game.bin')
+            zip_.writestr('roms/README', 'not a ROM')
+
+        members = list(atari2600.Memory.from_archive(self.path('roms.zip'), ['*.bin']))
+        self.assertEqual(['roms/game.bin'], [name for name, memory in members])
+        self.assertEqual(0xf800, members[0][1].start)
+
+    def test_tar_gz(self):
+        tar = tarfile.open(self.path('roms.tar.gz'), 'w:gz')
+        tar.add(self.rom, 'game.bin')
+        tar.close()
+
+        self.assertTrue(archive.is_archive(self.path('roms.tar.gz')))
+        self.assertEqual([('game.bin', ROM)],
+                         [(name, file_.read()) for name, file_ in archive.open_members(self.path('roms.tar.gz'))])
+
+    def test_member_stem(self):
+        self.assertEqual('game', archive.member_stem('game.bin'))
+        self.assertEqual(os.path.join('a', 'game'), archive.member_stem('a/game.bin'))
+        self.assertEqual(os.path.join('b', 'game'), archive.member_stem('/../b/./game.bin'))
+
+    def test_rom_is_not_an_archive(self):
+        self.assertFalse(archive.is_archive(self.rom))
+
+    def test_rom_starting_with_zeros(self):
+        # taken for an empty tar archive by tarfile.is_tarfile()
+        with open(self.rom, 'wb') as file_:
+            file_.write('\0' * 2048 + ROM[2048:])
+
+        self.assertTrue(tarfile.is_tarfile(self.rom))
+        self.assertFalse(archive.is_archive(self.rom))
+
+    def test_tar_bz2(self):
+        tar = tarfile.open(self.path('roms.tar.bz2'), 'w:bz2')
+        tar.add(self.rom, 'game.bin')
+        tar.close()
+
+        self.assertEqual('tar', archive.archive_kind(self.path('roms.tar.bz2')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import unittest
+
+import dis6502
+import memory
+
+from assembler import Assembler, AssemblyError, Mismatch, verify
+from support import ORG, traced
+from table import EXTENDED
+
+LISTING = '''WSYNC = $0002
+SWCHA = $0280
+       * = $F000
+
+    code
+START  LDA    #$00
+       STA    WSYNC
+       STA    $0080
+       LDA    SWCHA
+       LDA    LF015,X
+       STA    ($80),Y
+       ASL
+       BNE    START
+       JMP    (LF017)
+LF015  .byt $0A , $0B
+LF017  .word START , LF015+1
+'''
+
+IMAGE = ('\xa9\x00\x85\x02\x8d\x80\x00\xad\x80\x02\xbd\x15\xf0\x91\x80\x0a\xd0\xee\x6c\x17\xf0' +
+         '\x0a\x0b\x00\xf0\x16\xf0')
+
+class TestAssembler(unittest.TestCase):
+    def test_listing(self):
+        assembler = Assembler().assemble(LISTING.splitlines())
+        self.assertEqual([], assembler.errors)
+        self.assertEqual(IMAGE, str(assembler.image[ORG:ORG+len(IMAGE)]))
+        self.assertEqual([], assembler.compare(IMAGE, ORG))
+
+    def test_mismatches(self):
+        # STA $0002 instead of the zero page STA WSYNC: everything after moves
+        rom = IMAGE[:2] + '\x8d\x02\x00' + IMAGE[4:]
+        errors, mismatches = verify(LISTING.splitlines(), rom, ORG, limit=2)
+        self.assertEqual([], errors)
+        self.assertEqual([Mismatch(ORG + 2, 0x8d, 0x85, 7), Mismatch(ORG + 4, 0x00, 0x8d, 8)], mismatches)
+
+    def test_errors(self):
+        errors, mismatches = verify(['       * = $F000', '       JMP    LF123', '       LDA    ($1234),Y', '       FOO'], '', ORG)
+        self.assertEqual(['line 2: undefined symbol LF123', 'line 3: operand out of range',
+                          'line 4: unknown instruction FOO'], sorted(str(error) for error in errors))
+
+    def test_undocumented(self):
+        lines = ['       * = $F000', '       LAX    $80']
+        self.assertEqual(['line 2: unknown instruction LAX'], [str(error) for error in Assembler().assemble(lines).errors])
+        self.assertEqual([], verify(lines, '\xa7\x80', ORG, undocumented=True)[1])
+
+    def test_round_trip(self):
+        class args:
+            undocumented = False
+
+        code = IMAGE[:18] + '\x60' + IMAGE[21:]
+        mem = traced(code, size=len(code), symbols={0x02: 'WSYNC', 0x280: 'SWCHA'}, start_label='START')
+        self.assertEqual('OK', dis6502.verify(args, mem))
+
+    def test_every_opcode(self):
+        # each opcode with a zero page address, #$05, an absolute address
+        # in the ROM or a branch to the next instruction as operand
+        operands = {1: '', 2: '\x80', 3: '\x00\xf0'}
+        code, starts = '', []
+        for byte, opcode in sorted(EXTENDED.items()):
+            starts.append(ORG + len(code))
+            operand = operands[opcode.size]
+            if opcode.src in (memory.M_IMM, memory.M_REL):
+                operand = '\x05' if opcode.src == memory.M_IMM else '\x00'
+            code += chr(byte) + operand
+
+        class args:
+            undocumented = True
+
+        mem = memory.Memory(code, ORG, undocumented=True)
+        mem.trace_code(starts)
+        self.assertEqual({}, mem.faults)
+        self.assertEqual(len(EXTENDED), len(mem.traced_instrs()))
+        self.assertEqual('OK', dis6502.verify(args, mem))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from callgraph import CallGraph
+from support import ORG, traced
+
+def graph(*routines):
+    return CallGraph(traced(''.join(code.ljust(0x10, '\xea') for code in routines)), [ORG])
+
+class TestCallGraph(unittest.TestCase):
+    def test_edges_are_deduplicated(self):
+        # F000 JSR F010, JSR F010, JMP F000; F010 RTS
+        g = graph('\x20\x10\xf0\x20\x10\xf0\x4c\x00\xf0', '\x60')
+        edges = [(routine.addr, kind, sites) for routine, kind, dest, (sites, depth) in g.edges()]
+        self.assertEqual([(ORG, 'call', 2), (ORG, 'jump', 1)], edges)
+
+    def test_stack(self):
+        # F000 JSR F010, JMP F000; F010 PHA, PHP, JSR F020, PLP, PLA, RTS; F020 RTS
+        g = graph('\x20\x10\xf0\x4c\x00\xf0', '\x48\x08\x20\x20\xf0\x28\x68\x60', '\x60')
+        start = g.routines[ORG]
+        self.assertFalse(start.recursive)
+        self.assertEqual(2, start.depth)
+        self.assertEqual(2 + 2, g.routines[ORG + 0x10].stack)
+        self.assertEqual(2 + 2 + 2, start.stack)
+
+    def test_recursion(self):
+        # F000 JSR F010, RTS; F010 JSR F020, RTS; F020 JSR F010, RTS
+        g = graph('\x20\x10\xf0\x60', '\x20\x20\xf0\x60', '\x20\x10\xf0\x60')
+        self.assertTrue(g.routines[ORG + 0x10].recursive)
+        self.assertTrue(g.routines[ORG + 0x10].unbounded)
+        # calling a recursive routine doesn't make the caller recursive
+        self.assertFalse(g.routines[ORG].recursive)
+        self.assertTrue(g.routines[ORG].unbounded)
+        self.assertEqual(None, g.routines[ORG].stack)
+        self.assertEqual([[ORG + 0x10, ORG + 0x20]], [scc for scc in g.sccs if len(scc) > 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+
+from StringIO import StringIO
+
+import memory
+
+from support import ORG, traced
+from table import TABLE
+
+def listing(code):
+    mem = traced(code, fill='\0')
+
+    out, sys.stdout = sys.stdout, StringIO()
+    try:
+        mem.dis()
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = out
+
+class TestDis(unittest.TestCase):
+    def test_operands(self):
+        # ASL A, LDA #$10, STA $80, TAX, JSR $F00A, RTS, RTS
+        lines = listing('\x0a\xa9\x10\x85\x80\xaa\x20\x0a\xf0\x60\x60').splitlines()
+        self.assertEqual(['       ASL    ',
+                          '       LDA    #$10',
+                          '       STA    $80',
+                          '       TAX    ',
+                          '       JSR    L%04X' % (ORG + 10),
+                          '       RTS    ',
+                          '',
+                          'L%04X  RTS    ' % (ORG + 10),
+                          ''], lines[:9])
+
+    def test_data(self):
+        lines = listing('\x60').splitlines()
+        self.assertEqual('       .byt $00 , $00 , $00', lines[2][:27])
+        self.assertEqual(17, lines[2].count('$'))
+
+    def test_formatter_cache(self):
+        opcode = TABLE[0x60]
+        self.assertTrue(memory.formatter(opcode) is memory.formatter(opcode))
+        self.assertEqual(('%s RTS    \n\n', None), memory.formatter(opcode))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import unittest
+
+import memory
+
+from support import ORG, traced
+
+class TestFaults(unittest.TestCase):
+    def test_path_given_up(self):
+        # BEQ F010, JSR F020, RTS; F010 LDA #$01 and an unknown opcode; F020 RTS
+        mem = traced('\xf0\x0e\x20\x20\xf0\x60'.ljust(0x10, '\xea') +
+                     '\xa9\x01\x02'.ljust(0x10, '\xea') + '\x60')
+        self.assertEqual([ORG + 0x10], mem.faults.keys())
+        fault = mem.faults[ORG + 0x10]
+        self.assertEqual(ORG + 0x12, fault.addr)
+        self.assertTrue(isinstance(fault.error, memory.UnknownOpcodeError))
+        self.assertEqual('unknown opcode 02 at addr F012', str(fault.error))
+
+        # the other paths are kept, the failing one is dropped
+        self.assertEqual(set([ORG, ORG + 0x20]), set(mem.segments))
+        self.assertFalse(mem.is_addr_executable(ORG + 0x10))
+        self.assertFalse('r' in mem.annotations[ORG + 0x11])
+
+    def test_truncated(self):
+        mem = traced('\xea\xea\xad\x00', size=4)
+        self.assertEqual('truncated LDA at addr F002', str(mem.faults[ORG].error))
+
+    def test_undocumented(self):
+        # LAX $80, DCP $81, SKB #$00, RTS
+        code = '\xa7\x80\xc7\x81\x80\x00\x60'
+        self.assertTrue(ORG in traced(code).faults)
+
+        mem = traced(code, undocumented=True)
+        self.assertEqual({}, mem.faults)
+        self.assertEqual(['LAX', 'DCP', 'SKB', 'RTS'], [instr.opcode.mnemonic for addr, instr in mem.traced_instrs()])
+        self.assertEqual([(0x81, 'm')], mem.access.counted[ORG + 2])
+
+    def test_aliases(self):
+        # NOP_1A, SKB_89 #$00, SBC_EB #$05, RTS
+        mem = traced('\x1a\x89\x00\xeb\x05\x60', undocumented=True)
+        self.assertEqual(['NOP_1A', 'SKB_89', 'SBC_EB', 'RTS'], [instr.opcode.mnemonic for addr, instr in mem.traced_instrs()])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from fingerprint import FingerprintIndex, fingerprint
+from support import ORG
+from support import traced as trace
+
+# LDX #$05, LDA $F100,X, STA $80,X, DEX, BPL -7, RTS
+ROUTINE = '\xa2\x05\xbd%s\x95%s\xca\x10\xf8\x60'
+
+def traced(at, table, variable='\x80'):
+    routine = ROUTINE % (table, variable)
+    image = ('\x20' + chr(at & 0xff) + chr(at >> 8) + '\x60').ljust(at - ORG, '\xea') + routine
+    return trace(image, size=0x200, start_label='START')
+
+class TestFingerprint(unittest.TestCase):
+    def test_relocated_routine(self):
+        self.assertEqual(fingerprint(traced(0xf010, '\x00\xf1'), 0xf010),
+                         fingerprint(traced(0xf080, '\x40\xf1'), 0xf080))
+
+    def test_ram_variables(self):
+        self.assertEqual(fingerprint(traced(0xf010, '\x00\xf1'), 0xf010),
+                         fingerprint(traced(0xf010, '\x00\xf1', '\x90'), 0xf010))
+        # a TIA register isn't masked
+        self.assertNotEqual(fingerprint(traced(0xf010, '\x00\xf1'), 0xf010),
+                            fingerprint(traced(0xf010, '\x00\xf1', '\x1b'), 0xf010))
+
+    def test_data_after_routine(self):
+        # LDA #$00, STA $80,X, BRK, ... after the RTS: data, not hashed
+        mem = traced(0xf010, '\x00\xf1')
+        data = '\xa9\x00\x95\x80\x00'
+        image = mem.memory[:0x1b] + data + mem.memory[0x1b+len(data):]
+        self.assertEqual(fingerprint(mem, 0xf010), fingerprint(trace(image, size=0x200, start_label='START'), 0xf010))
+        self.assertEqual(6, fingerprint(mem, 0xf010)[1])
+
+    def test_untraced_entry(self):
+        # a symbol on data decoding as instructions, never reached
+        mem = traced(0xf010, '\x00\xf1')
+        mem.add_symbol(0xf01b, 'START')
+        self.assertEqual(0, fingerprint(mem, 0xf01b)[1])
+
+    def test_different_routine(self):
+        other = traced(0xf010, '\x00\xf1')
+        self.assertNotEqual(fingerprint(traced(0xf010, '\x00\xf1'), 0xf010), fingerprint(other, ORG))
+
+    def test_identify(self):
+        index = FingerprintIndex(':memory:')
+
+        known = traced(0xf010, '\x00\xf1')
+        known.add_symbol(0xf010, 'COPY')
+        self.assertEqual(1, index.learn(known))
+
+        unknown = traced(0xf080, '\x40\xf1')
+        self.assertEqual([(0xf080, 'COPY')], index.identify(unknown))
+        self.assertEqual('COPY', unknown.addr_label(0xf080))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import unittest
+
+import memory
+
+from operands import *
+from support import ORG
+
+class TestOperands(unittest.TestCase):
+    def test_singletons(self):
+        self.assertTrue(M_AC() is M_AC())
+        self.assertTrue(M_NONE() is M_NONE())
+        self.assertEqual(M_AC(), M_AC())
+        self.assertNotEqual(M_AC(), M_XR())
+
+    def test_interned(self):
+        self.assertTrue(M_IMM(immed=5) is M_IMM(immed=5))
+        # equal when they have the same mode and value, see Operand
+        self.assertEqual(M_IMM(immed=5), M_IMM(immed=5))
+        self.assertNotEqual(M_IMM(immed=5), M_IMM(immed=6))
+        self.assertNotEqual(M_ZERO(addr=0x80), M_ABS(addr=0x80))
+        self.assertFalse(M_ZERO(addr=0x80) is M_ABS(addr=0x80))
+        self.assertEqual('$80', repr(M_ZERO(addr=0x80)))
+        self.assertEqual('$0080', repr(M_ABS(addr=0x80)))
+        self.assertEqual(-2, M_REL(offset=0xfe).offset)
+
+    def test_slots(self):
+        self.assertFalse(hasattr(M_ABSX(addr=0x1000), '__dict__'))
+        self.assertFalse(hasattr(M_FC(), '__dict__'))
+
+    def test_shared_instructions(self):
+        # LDA #$10, LDA #$10
+        mem = memory.Memory('\xa9\x10\xa9\x10', ORG)
+        self.assertTrue(mem.dis_instruction(ORG) is mem.dis_instruction(ORG + 2))
+
+if __name__ == '__main__':
+    unittest.main()
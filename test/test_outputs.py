@@ -0,0 +1,127 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import dis6502
+
+from support import ORG, traced
+
+# START LDA #$00 / STA $80 / JMP START
+IMAGE = '\xa9\x00\x85\x80\x4c\x00\xf0'
+
+class Args(object):
+    memory_map = disassemble = call_graph = ram_usage = verify = False
+    addr_info = []
+    search = None
+    where = None
+    undocumented = False
+    export_symbols = None
+    symbol_format = 'dasm'
+    call_graph_format = 'dot'
+
+    def __init__(self, output=None, outputs={}, **modes):
+        self.output = output
+        self.outputs = outputs
+        self.__dict__.update(modes)
+
+class TestOutputs(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, name):
+        with open(os.path.join(self.dir, name)) as file_:
+            return file_.read()
+
+    def test_output_path(self):
+        self.assertEqual(('disassemble', 'game.s'), dis6502.output_path('disassemble=game.s'))
+        self.assertEqual((None, 'out.txt'), dis6502.output_path('out.txt'))
+        self.assertEqual((None, 'a=b.txt'), dis6502.output_path('a=b.txt'))
+
+    def test_destinations(self):
+        args = Args(output='all.txt', outputs={'disassemble': 'game.s'},
+                    memory_map=True, disassemble=True, verify=True)
+
+        self.assertEqual([('all.txt', ['memory_map', 'verify']), ('game.s', ['disassemble'])],
+                         dis6502.destinations(args))
+
+    def test_destinations_stdout(self):
+        args = Args(outputs={'memory_map': 'maps/{name}.txt'}, memory_map=True, ram_usage=True)
+
+        self.assertEqual([('maps/{name}.txt', ['memory_map']), (None, ['ram_usage'])],
+                         dis6502.destinations(args))
+
+    def test_render_files(self):
+        listing = os.path.join(self.dir, 'game.s')
+        rest = os.path.join(self.dir, 'rest.txt')
+        args = Args(output=rest, outputs={'disassemble': listing},
+                    disassemble=True, verify=True, addr_info=[ORG, ORG + 2])
+
+        mem = traced(IMAGE, start_label='START')
+        dis6502.render(args, mem, [ORG])
+
+        self.assertEqual(dis6502.listing(mem), open(listing).readlines())
+        lines = self.read('rest.txt').splitlines()
+        self.assertEqual(['0xf000', 'START'], lines[0].split()[:2])
+        self.assertEqual(['0xf002', 'LF002'], lines[1].split()[:2])
+        self.assertEqual('OK', lines[2])
+
+    def test_render_members(self):
+        maps = os.path.join(self.dir, 'maps', '{name}.txt')
+        args = Args(output=maps, memory_map=True)
+
+        mem = traced(IMAGE, start_label='START')
+        dis6502.render(args, mem, [ORG], name=os.path.join('a', 'game'), header='==> a/game.bin <==\n')
+        dis6502.render(args, mem, [ORG], name=os.path.join('b', 'game'), header='==> b/game.bin <==\n')
+
+        self.assertEqual(self.read(os.path.join('maps', 'a', 'game.txt')), self.read(os.path.join('maps', 'b', 'game.txt')))
+        self.assertFalse(self.read(os.path.join('maps', 'a', 'game.txt')).startswith('==>'))
+
+    def test_export_symbols_members(self):
+        args = Args(export_symbols=os.path.join(self.dir, '{name}.sym'))
+
+        mem = traced(IMAGE, start_label='START')
+        dis6502.render(args, mem, [ORG], name=os.path.join('a', 'game'))
+        dis6502.render(args, mem, [ORG], name=os.path.join('b', 'game'))
+
+        self.assertTrue('START' in self.read(os.path.join('a', 'game.sym')))
+        self.assertTrue('START' in self.read(os.path.join('b', 'game.sym')))
+
+    def test_export_symbols_archive_needs_name(self):
+        args = Args(export_symbols=os.path.join(self.dir, 'game.sym'))
+        args.romfile, args.members = None, ['*']
+
+        self.assertRaises(RuntimeError, dis6502.render_archive, args, None)
+
+    def test_traced_instrs_cache(self):
+        mem = traced(IMAGE, start_label='START')
+        instrs = mem.traced_instrs()
+        self.assertTrue(mem.traced_instrs() is instrs)
+
+        mem.forget_segments([ORG])
+        self.assertEqual([], mem.traced_instrs())
+
+        mem.trace_code([ORG])
+        self.assertEqual([addr for addr, instr in instrs], [addr for addr, instr in mem.traced_instrs()])
+
+if __name__ == '__main__':
+    unittest.main()
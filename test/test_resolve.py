@@ -0,0 +1,60 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from resolve import resolve_indirect
+from support import ORG, image, traced
+
+def resolved(*chunks):
+    """Trace and resolve an image made of (addr, code) chunks, filled with BRK."""
+    mem = traced(image(chunks, size=0x200, fill='\0'))
+    resolve_indirect(mem)
+    return mem
+
+class TestResolver(unittest.TestCase):
+    def test_jmp_indirect_through_zero_page(self):
+        # LDA #$20, STA $80, LDA #$F0, STA $81, JMP ($0080)
+        mem = resolved((ORG, '\xa9\x20\x85\x80\xa9\xf0\x85\x81\x6c\x80\x00'),
+                       (0xf020, '\x60'))
+        self.assertEqual({ORG + 8: set([0xf020])}, mem.dispatches)
+        self.assertTrue(0xf020 in mem.segments)
+
+    def test_rts_dispatch_table(self):
+        # LDA $80, ASL, TAX, LDA $F101,X, PHA, LDA $F100,X, PHA, RTS
+        # with a table of 2 words, the destinations minus one
+        mem = resolved((ORG, '\xa5\x80\x0a\xaa\xbd\x01\xf1\x48\xbd\x00\xf1\x48\x60'),
+                       (0xf100, '\x1f\xf0\x2f\xf0'),
+                       (0xf020, '\x60'),
+                       (0xf030, '\x60'))
+        self.assertEqual(set([0xf020, 0xf030]), mem.dispatches[ORG + 12])
+
+    def test_fixpoint(self):
+        # the destination of the first indirect jump does another one
+        mem = resolved((ORG, '\x6c\x00\xf1'),
+                       (0xf100, '\x10\xf0\x20\xf0'),
+                       (0xf010, '\x6c\x02\xf1'),
+                       (0xf020, '\x60'))
+        self.assertEqual(set([ORG, 0xf010, 0xf020]), set(mem.segments))
+
+    def test_unknown_pointer(self):
+        # LDA $90, STA $80, JMP ($0080)
+        mem = resolved((ORG, '\xa5\x90\x85\x80\x6c\x80\x00'))
+        self.assertEqual({}, mem.dispatches)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import unittest
+
+import memory
+import search
+
+from store import Store
+from support import ORG
+from support import traced as trace
+
+# F000 LDA #$00, STA WSYNC, LDA ($80),Y, STA $81,X, BNE F000, RTS; F010 data
+ROM = ('\xa9\x00\x85\x02\xb1\x80\x95\x81\xd0\xf6\x60'.ljust(0x10, '\xff') +
+       '\xa9\x01\x85\x02').ljust(0x100, '\xff')
+
+def traced():
+    return trace(ROM, symbols={0x02: 'WSYNC'}, start_label='START')
+
+class TestParse(unittest.TestCase):
+    def test_instructions(self):
+        self.assertEqual([search.InstrPattern('STA', frozenset([memory.M_ZERX, memory.M_ABSX]), ('$', '8?'))],
+                         search.parse('sta $8?,x'))
+        self.assertEqual([search.InstrPattern(None, None, None)], search.parse('*'))
+
+    def test_aliases(self):
+        self.assertEqual(set([0x80, 0x82, 0x89, 0xc2, 0xe2]), search.opcodes_matching(search.parse('SKB #*')[0]))
+        self.assertEqual(set([0x89]), search.opcodes_matching(search.parse('SKB_89 #*')[0]))
+
+    def test_bytes(self):
+        self.assertEqual([0xa9, None, 0x85], search.parse('A9 ?? 85'))
+
+    def test_invalid(self):
+        self.assertRaises(search.SearchSyntaxError, search.parse, 'LDA (')
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = search.SearchIndex(traced())
+
+    def test_instructions(self):
+        self.assertEqual([(ORG + 2, 2), (ORG + 0x12, 2)], self.index.search('STA WSYNC'))
+        self.assertEqual([(ORG + 4, 2)], self.index.search('LDA (*),Y'))
+        self.assertEqual([(ORG + 6, 2)], self.index.search('STA $8?,X'))
+        self.assertEqual([(ORG + 8, 2)], self.index.search('BNE START'))
+
+    def test_sequences(self):
+        # the third instruction makes it use the opcode trigrams
+        self.assertEqual([(ORG, 6)], self.index.search('LDA #*; STA WSYNC; LDA (*),Y'))
+        self.assertEqual([(ORG, 4), (ORG + 0x10, 4)], self.index.search('LDA #$0?; STA *'))
+
+    def test_where(self):
+        self.assertEqual([(ORG + 0x12, 2)], self.index.search('STA WSYNC', 'data'))
+        self.assertEqual([(ORG + 2, 2)], self.index.search('STA WSYNC', 'code'))
+
+    def test_bytes(self):
+        self.assertEqual([(ORG, 4), (ORG + 0x10, 4)], self.index.search('A9 ?? 85 02'))
+        self.assertEqual([(ORG + 0x10, 2)], self.index.search('A9 01', 'data'))
+        self.assertEqual([(ORG + 0xfe, 2)], self.index.search('FF ??')[-1:])
+
+class TestSearchStore(unittest.TestCase):
+    def test_corpus(self):
+        store = Store(':memory:')
+        store.add('a.bin', traced(), [ORG])
+        store.add('b.bin', traced(), [ORG])
+
+        self.assertEqual([('a.bin', ORG + 2, '\x85\x02'), ('b.bin', ORG + 2, '\x85\x02')],
+                         list(search.search_store(store.db, 'STA WSYNC', 'code')))
+        self.assertEqual([('a.bin', ORG, '\xa9\x00\x85\x02\xb1\x80')],
+                         list(search.search_store(store.db, 'LDA #*; STA WSYNC; LDA (*),Y'))[:1])
+        self.assertEqual(['a.bin', 'b.bin'],
+                         [name for name, addr, data in search.search_store(store.db, 'A9 01 85')])
+        # ending with the image
+        self.assertEqual([ORG + 0xfe, ORG + 0xfe],
+                         [addr for name, addr, data in search.search_store(store.db, 'FF FF') if addr == ORG + 0xfe])
+
+if __name__ == '__main__':
+    unittest.main()
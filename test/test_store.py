@@ -0,0 +1,85 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+import dis6502
+
+from store import Store
+from support import ORG, traced
+
+# F000 JSR F010, JMP F000; F010 STA $02, RTS
+ROM = '\x20\x10\xf0\x4c\x00\xf0'.ljust(0x10, '\xea') + '\x85\x02\x60'.ljust(0xf0, '\xea')
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.store = Store(':memory:')
+
+        mem = traced(ROM, symbols={0x02: 'WSYNC'}, start_label='START')
+        self.store.add('game.bin', mem, [ORG])
+        self.store.add('game.bin', mem, [ORG])
+
+    def test_rom_added_once(self):
+        self.assertEqual([('game.bin', 0x100, 9)], list(self.store.query('SELECT name, size, code_bytes FROM roms')))
+
+    def test_writes(self):
+        self.assertEqual([('game.bin', 'START')], list(self.store.query('writes', ('WSYNC', 'START'))))
+
+    def test_blocks(self):
+        self.assertEqual([(ORG, ORG + 6), (ORG + 0x10, ORG + 0x13)],
+                         list(self.store.query('SELECT start, stop FROM blocks ORDER BY start')))
+
+class TestStoreArchives(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def run_dis6502(self, *argv):
+        saved = sys.argv
+        sys.argv = ['dis6502.py'] + list(argv)
+        try:
+            dis6502.main()
+        finally:
+            sys.argv = saved
+
+    def test_same_member_in_two_archives(self):
+        rom = '\xea' * 2044 + '\x00\xf8\x00\xf8'
+        for name in ('a.zip', 'b.zip'):
+            with zipfile.ZipFile(self.path(name), 'w') as zip_:
+                zip_.writestr('game.bin', rom)
+
+        db = self.path('roms.db')
+        self.run_dis6502('--store', db, self.path('a.zip'))
+        self.run_dis6502('--store', db, self.path('b.zip'))
+
+        store = Store(db)
+        self.assertEqual([self.path('a.zip') + '/game.bin', self.path('b.zip') + '/game.bin'],
+                         [name for name, in store.query('SELECT name FROM roms ORDER BY name')])
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
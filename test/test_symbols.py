@@ -0,0 +1,93 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from StringIO import StringIO
+
+import atari2600
+import memory
+import symbols
+
+from symbols import SymbolTable
+
+class TestSymbolTable(unittest.TestCase):
+    def test_defaults_are_not_modified(self):
+        defaults = {0x02: 'WSYNC'}
+        table = SymbolTable(defaults)
+        table.add(0xf000, 'START')
+        self.assertEqual({0x02: 'WSYNC'}, defaults)
+        self.assertEqual([(0x02, 'WSYNC'), (0xf000, 'START')], table.items())
+
+    def test_from_file_does_not_leak_symbols(self):
+        atari2600.Memory.from_file(StringIO('\xea' * 2048), None, {0xf800: 'START'})
+        self.assertFalse(0xf800 in atari2600.SYMBOLS)
+
+    def test_memory_copies_the_table(self):
+        table = SymbolTable({0x02: 'WSYNC'})
+        table.add(0xf100, 'DATA', bank=1)
+        a = memory.Memory('\xea', 0xf000, symbols=table)
+        b = memory.Memory('\xea', 0xf000, symbols=table)
+
+        a.add_symbol(0xf000, 'START')
+        a.symbols.add(0xf100, 'OTHER', bank=1)
+        self.assertFalse(0xf000 in b.symbols)
+        self.assertFalse(0xf000 in table)
+        self.assertEqual({0xf100: 'DATA'}, table.banks[1])
+
+    def test_range(self):
+        table = SymbolTable()
+        table.update({0x80: 'A', 0x90: 'B', 0xf000: 'C'})
+        self.assertEqual([(0x80, 'A'), (0x90, 'B')], table.range(0x80, 0xff))
+
+    def test_update_range(self):
+        table = SymbolTable()
+        table.update({0x80: 'A', 0xf000: 'C'}, start=0xf000, end=0xffff)
+        self.assertEqual([(0xf000, 'C')], table.items())
+
+    def test_bank(self):
+        table = SymbolTable()
+        table.add(0xf000, 'START')
+        table.add(0xf000, 'BANK1', bank=1)
+        self.assertEqual('START', table[0xf000])
+        table.select_bank(1)
+        self.assertEqual('BANK1', table[0xf000])
+
+class TestSymbolFormats(unittest.TestCase):
+    pairs = [(0x02, 'WSYNC'), (0xf000, 'START')]
+
+    def round_trip(self, fmt):
+        file_ = StringIO()
+        symbols.write(file_, self.pairs, fmt)
+        file_.seek(0)
+        return sorted(symbols.read(file_, fmt))
+
+    def test_dasm(self):
+        self.assertEqual(self.pairs, self.round_trip('dasm'))
+
+    def test_vice(self):
+        self.assertEqual(self.pairs, self.round_trip('vice'))
+
+    def test_ca65(self):
+        self.assertEqual(self.pairs, self.round_trip('ca65'))
+
+    def test_read_ld65_labels(self):
+        file_ = StringIO('al 00F000 .START\nal 000002 .WSYNC\n')
+        self.assertEqual([(0xf000, 'START'), (0x02, 'WSYNC')], list(symbols.read_vice(file_)))
+
+if __name__ == '__main__':
+    unittest.main()
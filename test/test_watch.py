@@ -0,0 +1,93 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import watch
+
+from resolve import resolve_indirect
+from support import ORG, image, traced
+
+# F000 JSR F010, JMP F000; F010 RTS; F020 NOP, RTS
+ROM = ('\x20\x10\xf0\x4c\x00\xf0'.ljust(0x10, '\xea') +
+       '\x60'.ljust(0x10, '\xea') +
+       '\xea\x60').ljust(0x100, '\xea')
+
+# F000 LDA #$20, STA $80, LDA #$F0, STA $81, JMP ($0080); F020 LDA $80, RTS; F030 LDA $81, RTS
+DISPATCH = image([(ORG, '\xa9\x20\x85\x80\xa9\xf0\x85\x81\x6c\x80\x00'),
+                  (ORG + 0x20, '\xa5\x80\x60'),
+                  (ORG + 0x30, '\xa5\x81\x60')])
+
+def resolved(image):
+    mem = traced(image)
+    resolve_indirect(mem)
+    return mem
+
+def state(mem):
+    annotations = dict((addr, kinds) for addr, kinds in mem.annotations.items() if kinds)
+    return (annotations, mem.calls, mem.jumps, sorted(mem.executable_ranges), sorted(mem.segments),
+            mem.access.counted, mem.access.reads, mem.access.writes, mem.dispatches)
+
+def watcher(mem, refine=None):
+    result = watch.Watcher(None, None, None, refine=refine)
+    result.memory = mem
+    result.starts = [ORG]
+    return result
+
+class TestWatcher(unittest.TestCase):
+    def test_changed_addrs(self):
+        self.assertEqual([ORG + 1, ORG + 0x80], watch.changed_addrs('\0' * 0x100, '\0\1' + '\0' * 0x7e + '\1' + '\0' * 0x7f, ORG))
+
+    def test_incremental_update_matches_full_trace(self):
+        w = watcher(traced(ROM))
+
+        patched = ROM[:1] + '\x20' + ROM[2:]
+        self.assertTrue(w.update(patched))
+        self.assertEqual(state(traced(patched)), state(w.memory))
+        self.assertFalse(ORG + 0x10 in w.memory.segments)
+
+    def test_resolved_dispatch_kept(self):
+        w = watcher(resolved(DISPATCH), resolve_indirect)
+
+        patched = DISPATCH[:0x40] + '\x60' + DISPATCH[0x41:]
+        self.assertTrue(w.update(patched))
+        self.assertTrue(ORG + 0x20 in w.memory.segments)
+        self.assertEqual(state(resolved(patched)), state(w.memory))
+
+    def test_resolved_dispatch_moved(self):
+        w = watcher(resolved(DISPATCH), resolve_indirect)
+
+        # LDA #$30: the JMP (ind) goes to F030 instead
+        patched = DISPATCH[:1] + '\x30' + DISPATCH[2:]
+        self.assertTrue(w.update(patched))
+        self.assertFalse(ORG + 0x20 in w.memory.segments)
+        self.assertEqual({ORG + 8: set([ORG + 0x30])}, w.memory.dispatches)
+        self.assertEqual(state(resolved(patched)), state(w.memory))
+
+    def test_fault_fixed(self):
+        # F000 BEQ F010, RTS; F010 an unknown opcode
+        image = '\xf0\x0e\x60'.ljust(0x10, '\xea') + '\x02'.ljust(0xf0, '\xea')
+        w = watcher(traced(image))
+        self.assertTrue(ORG + 0x10 in w.memory.faults)
+
+        patched = image[:0x10] + '\x60' + image[0x11:]
+        self.assertTrue(w.update(patched))
+        self.assertEqual({}, w.memory.faults)
+        self.assertEqual(state(traced(patched)), state(w.memory))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+# Copyright (c) 2011, Gabriele Favalessa
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import time
+
+CHUNK = 64
+
+def changed_addrs(old, new, org):
+    """Sorted addresses of the bytes that differ between two equally sized images."""
+    changed = []
+
+    for offset in xrange(0, len(old), CHUNK):
+        if old[offset:offset+CHUNK] == new[offset:offset+CHUNK]:
+            continue
+
+        for i in xrange(offset, min(offset + CHUNK, len(old))):
+            if old[i] != new[i]:
+                changed.append(org + i)
+
+    return changed
+
+class Watcher(object):
+    """Keep the analysis of a ROM file up to date while it gets rebuilt.
+
+    analyse(file_) loads and traces a ROM, returning (memory, starts);
+    render(memory, starts) writes the outputs and refine(memory), if given,
+    is run again after tracing incrementally. When the file changes only
+    the segments containing modified bytes are traced again, unless an
+    entry point vector changed, in which case everything is reloaded."""
+
+    def __init__(self, path, analyse, render, interval=0.5, refine=None):
+        self.path = path
+        self.analyse = analyse
+        self.render = render
+        self.interval = interval
+        self.refine = refine
+
+        self.stat = None
+        self.memory = None
+        self.starts = None
+
+    def read(self):
+        with open(self.path, 'rb') as file_:
+            return file_.read()
+
+    def reload(self):
+        with open(self.path, 'rb') as file_:
+            self.memory, self.starts = self.analyse(file_)
+
+    def vectors_changed(self, changed):
+        annotations = self.memory.annotations
+
+        return any('*' in annotations.get(addr, ()) or '*' in annotations.get(addr-1, ())
+                   for addr in changed)
+
+    def update(self, image):
+        """Bring the analysis up to date with image, returning False if nothing changed."""
+        memory = self.memory
+
+        if memory is None or len(image) != len(memory.memory):
+            self.reload()
+            return True
+
+        changed = changed_addrs(memory.memory, image, memory.start)
+        if not changed:
+            return False
+
+        if self.vectors_changed(changed):
+            self.reload()
+            return True
+
+        memory.memory = image
+
+        dirty = memory.segments_touching(changed)
+
+        # the indirect jumps are resolved again by refine, from scratch: the
+        # pointers may have been changed anywhere
+        dirty.update(start for start, segment in memory.segments.items() if segment.last in memory.dispatches)
+        memory.dispatches = {}
+
+        logging.info('%d bytes changed, tracing %d segments again' % (len(changed), len(dirty)))
+
+        # the paths given up before may have been fixed
+        retry = memory.faults_touching(changed)
+        for start in retry:
+            del memory.faults[start]
+
+        memory.forget_segments(dirty)
+        memory.trace_code(dirty | retry)
+
+        if self.refine:
+            self.refine(memory)
+
+        # segments no longer reached from the entry points, e.g. the old
+        # destination of a patched JSR
+        unreachable = set(memory.segments) - memory.reachable_segments(self.starts)
+        if unreachable:
+            memory.forget_segments(unreachable)
+
+        reached = set(self.starts)
+        for segment in memory.segments.values():
+            reached.update(segment.successors)
+        for targets in memory.dispatches.values():
+            reached.update(targets)
+        for start in set(memory.faults) - reached:
+            del memory.faults[start]
+
+        return True
+
+    def poll(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # being rewritten
+            return False
+
+        stat = st.st_mtime, st.st_size
+        if stat == self.stat:
+            return False
+
+        self.stat = stat
+
+        began = time.time()
+        try:
+            if not self.update(self.read()):
+                return False
+        except Exception as e:
+            logging.error('%s, will reload on next change' % e)
+            self.memory = None
+            return False
+
+        self.render(self.memory, self.starts)
+        logging.info('Updated in %.1f ms' % ((time.time() - began) * 1000))
+
+        return True
+
+    def run(self):
+        while True:
+            self.poll()
+            time.sleep(self.interval)